@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Rows/sec of date-label detection and normalisation, before and after vectorising it.
+
+"before" is the per-label loop that march_resolver/date_resolver used, kept here only for comparison;
+"after" is date_gene_engine.find_dates + format_dates. Both must give the same formatted mapping.
+
+    python benchmarks/bench_dates.py --rows 60000 --repeat 5
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import date_gene_engine as engine
+
+
+def legacy(labels):
+    find = [g for g in labels if re.search("^MAR-|^APR-|^SEPT?-|^OCT-|^DEC-", g, flags=re.I)]
+    formatted = {}
+    for d in find:
+        zero_pad = re.search("[0-9]{2}", d)
+        num = re.findall("[0-9]*", d)
+        og_num = [x for x in num if x != ""]
+        month = re.findall("[A-Za-z]*", d)
+        og_month = [x for x in month if x != ""]
+        if not zero_pad:
+            formatted[d] = f"{og_month[0]}-0{og_num[0]}"
+        else:
+            formatted[d] = f"{og_month[0]}-{og_num[0]}"
+    return formatted
+
+
+def vectorised(labels):
+    return engine.format_dates(engine.find_dates(labels))
+
+
+def make_labels(rows, date_fraction, seed=0):
+    rng = np.random.default_rng(seed)
+    genes = np.array([f"GENE{i}" for i in range(rows)], dtype=object)
+    months = np.array(["MAR", "APR", "SEP", "SEPT", "OCT", "DEC"], dtype=object)
+    is_date = rng.random(rows) < date_fraction
+    days = rng.integers(1, 16, rows)
+    pad = rng.random(rows) < 0.5
+    dates = [f"{m}-{d:02d}" if z else f"{m}-{d}" for m, d, z in zip(months[rng.integers(0, len(months), rows)], days, pad)]
+    return np.where(is_date, np.array(dates, dtype=object), genes).tolist()
+
+
+def best_of(fn, labels, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(labels)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=60000)
+    parser.add_argument("--date-fraction", type=float, default=0.01, help="share of labels that are text dates")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    labels = make_labels(args.rows, args.date_fraction)
+    assert legacy(labels) == vectorised(labels), "vectorised mapping differs from the per-label loop"
+
+    for name, fn in [("before", legacy), ("after", vectorised)]:
+        seconds = best_of(fn, labels, args.repeat)
+        print(f"{name:>6}: {seconds * 1000:9.2f} ms  {args.rows / seconds:14,.0f} rows/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Time to show the sheet picker and to read one sheet of a multi-sheet workbook, before and after lazy loading.
+
+"before" parses every sheet with openpyxl, as the web tool used to before showing the sheet names; "after" lists
+the names with date_gene_io.excel_sheet_names and reads one sheet with date_gene_io.read_excel_sheet, once per
+installed engine. The workbook is generated unless --workbook names one.
+
+    python benchmarks/bench_excel.py --sheets 6 --rows 8000 --columns 12
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import date_gene_io as gene_io
+
+
+def make_workbook(path, sheets, rows, columns, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.Index([f"GENE{i}" for i in range(rows)], name="gene")
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        for s in range(sheets):
+            pd.DataFrame(rng.random((rows, columns)), index=index).to_excel(writer, sheet_name=f"Sheet{s + 1}")
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workbook", help="existing .xlsx to read instead of a generated one")
+    parser.add_argument("--sheets", type=int, default=6)
+    parser.add_argument("--rows", type=int, default=8000)
+    parser.add_argument("--columns", type=int, default=12)
+    args = parser.parse_args(argv)
+
+    path = args.workbook
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "bench.xlsx")
+        make_workbook(path, args.sheets, args.rows, args.columns)
+    sheet = gene_io.excel_sheet_names(path, engine="openpyxl")[0]
+
+    print(f"{'before':>20}: {timed(lambda: pd.read_excel(path, index_col=0, sheet_name=None, engine='openpyxl')):8.3f} s"
+          "  every sheet before the picker")
+    for engine in gene_io.EXCEL_ENGINES:
+        try:
+            names = timed(lambda: gene_io.excel_sheet_names(path, engine=engine))
+        except ImportError:
+            print(f"{engine:>20}: not installed")
+            continue
+        one = timed(lambda: gene_io.read_excel_sheet(path, sheet, engine=engine))
+        genes = timed(lambda: gene_io.read_excel_sheet(path, sheet, engine=engine, gene_column_only=True))
+        print(f"{'after ' + engine:>20}: {names:8.3f} s  sheet names, {one:8.3f} s  one sheet, "
+              f"{genes:8.3f} s  its gene column")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Rows/sec of reading numeric dates (e.g. 2001-03-09) back into Mon-DD labels, before and after batching it.
+
+"before" is one dateparser.parse call per distinct label, as numeric_mapping used to do, and is skipped when
+dateparser is not installed; "after" is date_gene_engine.numeric_mapping. Both must give the same mapping. The
+import time of dateparser is reported too, as the web tool paid it on every cold start.
+
+    python benchmarks/bench_numeric_dates.py --rows 60000 --repeat 3
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import date_gene_engine as engine
+
+
+def legacy(dateparser, numdate, options):
+    date_fmt = {"yyyy-dd-mm": "%Y-%d-%m", "yyyy-mm-dd": "%Y-%m-%d", "dd-mm-yyyy": "%d-%m-%Y",
+                "mm-dd-yyyy": "%m-%d-%Y"}[options.date_format]
+    extracted = {}
+    for n in set(numdate):
+        parsed = dateparser.parse(n, date_formats=[date_fmt])
+        if parsed is not None:
+            extracted[n] = parsed.strftime(engine.DATE_INFO[options.date_info])
+    return extracted
+
+
+def make_labels(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    years = rng.integers(1990, 2030, rows)
+    months = rng.integers(1, 13, rows)
+    days = rng.integers(1, 29, rows)
+    return [f"{y}-{d:02d}-{m:02d}" for y, m, d in zip(years, months, days)]
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=60000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    labels = make_labels(args.rows)
+    options = engine.ConversionOptions(date_format="yyyy-dd-mm", date_info="month-day")
+    runs = [("after", lambda: engine.numeric_mapping(labels, options))]
+
+    start = time.perf_counter()
+    try:
+        import dateparser
+    except ImportError:
+        print("dateparser is not installed; only timing the batched parser")
+    else:
+        print(f"import dateparser: {(time.perf_counter() - start) * 1000:9.2f} ms")
+        assert legacy(dateparser, labels, options) == engine.numeric_mapping(labels, options), \
+            "batched mapping differs from dateparser"
+        runs.insert(0, ("before", lambda: legacy(dateparser, labels, options)))
+
+    for name, fn in runs:
+        seconds = best_of(fn, args.repeat)
+        print(f"{name:>6}: {seconds * 1000:9.2f} ms  {args.rows / seconds:14,.0f} rows/sec")
+
+
+if __name__ == "__main__":
+    main()
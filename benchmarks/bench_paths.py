@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Time and peak memory of every conversion path on synthetic datasets, written as JSON to compare across commits.
+
+For each kind of file (see synthetic.py, plus a "mixed" file when --mix is given), number of rows and number of
+value columns, a dataset is generated once and every path below runs on it in a fresh interpreter, so the peak
+RSS of one run does not hide another:
+  read     pd.read_csv of the dataset
+  convert  engine.convert, i.e. march_resolver, date_resolver, numeric_date or nodates depending on the kind
+  original engine.convert with row_order="original", which swaps a new index onto the rows in place
+  relabel  engine.relabel on the gene and description columns only
+  stream   date_gene_io.convert_csv_chunked from the CSV into a temporary file
+  zip      date_gene_io.write_zip of the converted dataframe as CSV into memory
+  parquet  date_gene_io.read_table of the dataset saved as Parquet with zstd-compressed columns
+  tsv.zst  date_gene_io.read_table of the dataset saved as zstd-compressed TSV
+  genes    date_gene_io.read_table of the Parquet file with gene_column_only
+  stream_parquet  date_gene_io.convert_columnar_chunked from the Parquet file into a temporary file
+Seconds are the best of --repeat runs; peak_rss_growth_mb is how far the peak RSS rose above the RSS with the
+inputs loaded.
+
+    python benchmarks/bench_paths.py --rows 1000 100000 1000000 --columns 1 50 500 -o results.json
+    python benchmarks/bench_paths.py --rows 100000 --compare results.json
+    python benchmarks/bench_paths.py --kinds --mix text_dates=0.02 old_symbols=0.001 --march 8
+"""
+
+import argparse
+import io
+import json
+import os
+import pickle
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+import date_gene_engine as engine
+import date_gene_io as gene_io
+import synthetic
+
+PATHS = ["read", "convert", "original", "relabel", "stream", "zip", "parquet", "tsv.zst", "genes", "stream_parquet"]
+COPIES = {"parquet": "dataset.parquet", "tsv.zst": "dataset.tsv.zst"}  # the dataset saved in other formats, by path
+OPTIONS = engine.ConversionOptions(mar_resolution="description", date_format="yyyy-mm-dd")
+ORIGINAL_ORDER = engine.ConversionOptions(mar_resolution="description", date_format="yyyy-mm-dd", row_order="original")
+
+
+def _status_bytes(field):
+    with open("/proc/self/status") as fp:
+        for line in fp:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+    raise OSError(f"no {field} in /proc/self/status")
+
+
+def _peak_rss_bytes():
+    try:
+        return _status_bytes("VmHWM")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # kilobytes on Linux
+
+
+def _reset_peak():
+    """Start measuring the peak RSS from here; returns the RSS to measure growth from. On Linux the high-water mark
+    is reset, so loading the inputs does not count; elsewhere the peak since start-up is the best available."""
+    try:
+        with open("/proc/self/clear_refs", "w") as fp:
+            fp.write("5")
+        return _status_bytes("VmRSS")
+    except OSError:
+        return _peak_rss_bytes()
+
+
+def run_path(path, csv_path, pickle_path, repeat):
+    """Run one path in this (fresh) process; returns its best time, peak RSS growth and report status."""
+    reference = engine.default_index()
+    df = None
+    if path != "read":
+        with open(pickle_path, "rb") as fp:
+            df = pickle.load(fp)
+    cleaned = engine.convert(df, OPTIONS, reference)[0] if path == "zip" else None
+    out = tempfile.NamedTemporaryFile(suffix=".parquet" if path == "stream_parquet" else ".csv", delete=False).name
+    parquet_path = os.path.join(os.path.dirname(csv_path), COPIES["parquet"])
+
+    def once():
+        if path == "read":
+            return pd.read_csv(csv_path, index_col=0), None
+        if path == "convert":
+            return engine.convert(df, OPTIONS, reference)
+        if path == "original":
+            return engine.convert(df, ORIGINAL_ORDER, reference)
+        if path == "relabel":
+            return engine.relabel(df.index, OPTIONS, reference, df.iloc[:, 0])
+        if path == "stream":
+            return None, gene_io.convert_csv_chunked(csv_path, out, OPTIONS, reference)
+        if path in COPIES:
+            return gene_io.read_table(os.path.join(os.path.dirname(csv_path), COPIES[path])), None
+        if path == "genes":
+            return gene_io.read_table(parquet_path, gene_column_only=True), None
+        if path == "stream_parquet":
+            return None, gene_io.convert_columnar_chunked(parquet_path, out, "parquet", OPTIONS, reference)
+        return gene_io.write_zip({"bench": cleaned}, io.BytesIO()), None
+
+    baseline = _reset_peak()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result, report = once()
+        times.append(time.perf_counter() - start)
+        del result
+    os.remove(out)
+    return {"seconds": min(times), "peak_rss_growth_mb": (_peak_rss_bytes() - baseline) / 2 ** 20,
+            "status": None if report is None else report.status}
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=ROOT, check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {"commit": _git("rev-parse", "HEAD"), "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"), "python": platform.python_version(),
+            "pandas": pd.__version__, "numpy": np.__version__, "machine": platform.machine(), "cpus": os.cpu_count()}
+
+
+def _key(result):
+    return result["kind"], result["rows"], result["columns"], result["path"]
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as fp:
+        baseline = {_key(r): r for r in json.load(fp)["results"]}
+    print(f"\ncompared with {baseline_path}: time and peak memory ratios (new / old, below 1 is better)")
+    for result in results:
+        old = baseline.get(_key(result))
+        if old is None:
+            continue
+        memory = (f"{result['peak_rss_growth_mb'] / old['peak_rss_growth_mb']:6.2f}x"
+                  if old["peak_rss_growth_mb"] > 0 else "     -")
+        print(f"{'/'.join(map(str, _key(result))):>40}: time {result['seconds'] / old['seconds']:6.2f}x  memory {memory}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--columns", type=int, nargs="+", default=[1, 50])
+    parser.add_argument("--kinds", nargs="*", choices=synthetic.KINDS, default=list(synthetic.KINDS))
+    parser.add_argument("--paths", nargs="+", choices=PATHS, default=PATHS)
+    parser.add_argument("--fraction", type=float, default=0.01, help="share of genes that are dates or old symbols")
+    parser.add_argument("--mix", nargs="+", metavar="CATEGORY=SHARE",
+                        help=f"also run a mixed file with this share of each of {', '.join(synthetic.CATEGORIES)}")
+    parser.add_argument("--march", type=int, help="duplicated Mar-01/Mar-02 rows (default: 4 in files with dates)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("-o", "--output", help="write the results here as JSON")
+    parser.add_argument("--compare", help="earlier JSON results to compare with")
+    parser.add_argument("--child", nargs=3, metavar=("PATH", "CSV", "PICKLE"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_path(*args.child, args.repeat)))
+        return
+
+    try:
+        mixes = {kind: None for kind in args.kinds}
+        if args.mix:
+            mixes["mixed"] = synthetic.parse_mix(args.mix)
+    except ValueError as error:
+        parser.error(str(error))
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for kind, mix in mixes.items():
+            for rows in args.rows:
+                for columns in args.columns:
+                    csv_path = os.path.join(workdir, "dataset.csv")
+                    pickle_path = os.path.join(workdir, "dataset.pkl")
+                    df = synthetic.make_dataset(rows, columns, kind, args.fraction, mix=mix, march=args.march)
+                    df.to_csv(csv_path)
+                    df.to_parquet(os.path.join(workdir, COPIES["parquet"]), compression="zstd")
+                    gene_io.write_table(df, os.path.join(workdir, COPIES["tsv.zst"]), gene_io.FileFormat("tsv", "zstd"))
+                    with open(pickle_path, "wb") as fp:
+                        pickle.dump(df, fp, protocol=pickle.HIGHEST_PROTOCOL)
+                    del df
+                    for path in args.paths:
+                        command = [sys.executable, os.path.abspath(__file__), "--repeat", str(args.repeat),
+                                   "--child", path, csv_path, pickle_path]
+                        run = json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout)
+                        result = {"kind": kind, "rows": rows, "columns": columns, "path": path, **run}
+                        results.append(result)
+                        print(f"{kind:>11} {rows:>9,} x {columns:<4} {path:>14}: {run['seconds'] * 1000:10.1f} ms  "
+                              f"peak RSS +{run['peak_rss_growth_mb']:8.1f} MB  {run['status'] or ''}", flush=True)
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump({"environment": environment(), "results": results}, fp, indent=1)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
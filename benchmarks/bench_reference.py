@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Cold-start time and resident memory of the HGNC reference, with and without the on-disk cache.
+
+Each scenario runs in a fresh interpreter so that imports, page cache state aside, start from nothing:
+  parse     parse hgnc_complete_set.txt and build an in-memory SymbolIndex (no cache)
+  build     parse and write the .npy cache
+  mmap      open the existing cache with memory-mapping, as every later startup does
+Each reports the seconds taken, the peak RSS growth over the bare interpreter with pandas imported, and the
+time to look up 60k labels.
+
+    python benchmarks/bench_reference.py path/to/hgnc_complete_set.txt
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCENARIOS = ["parse", "build", "mmap"]
+
+
+def _peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # kilobytes on Linux
+
+
+def run_scenario(name, source, cache_dir):
+    import pandas as pd
+    import date_gene_reference as reference
+
+    baseline = _peak_rss_bytes()
+    start = time.perf_counter()
+    if name == "parse":
+        index = reference.SymbolIndex(reference.parse_hgnc_complete_set(source))
+    elif name == "build":
+        index = reference.SortedSymbolIndex(reference.build_hgnc_cache(source, cache_dir))
+    else:
+        index = reference.hgnc_index(source, cache_dir)
+    seconds = time.perf_counter() - start
+
+    labels = pd.Index([f"GENE{i}" for i in range(60000)])
+    start = time.perf_counter()
+    index.rename(labels, case_sensitive=False)
+    lookup = time.perf_counter() - start
+    return {"scenario": name, "entries": len(index), "seconds": seconds, "lookup_60k_seconds": lookup,
+            "peak_rss_growth_mb": (_peak_rss_bytes() - baseline) / 2 ** 20}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="hgnc_complete_set.txt")
+    parser.add_argument("--cache-dir", default=None, help="defaults to SOURCE.cache")
+    parser.add_argument("--scenario", choices=SCENARIOS, help=argparse.SUPPRESS)  # used for the child processes
+    args = parser.parse_args(argv)
+    cache_dir = args.cache_dir or args.source + ".cache"
+
+    if args.scenario:
+        print(json.dumps(run_scenario(args.scenario, args.source, cache_dir)))
+        return
+
+    for name in SCENARIOS:
+        command = [sys.executable, os.path.abspath(__file__), args.source, "--cache-dir", cache_dir, "--scenario", name]
+        result = json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout)
+        print(f"{name:>6}: {result['seconds'] * 1000:9.1f} ms  peak RSS +{result['peak_rss_growth_mb']:7.1f} MB  "
+              f"60k lookups {result['lookup_60k_seconds'] * 1000:6.1f} ms  ({result['entries']:,} symbols)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Throughput and latency of the HTTP service (date_gene_service.py) under a local client.
+
+The service runs under uvicorn in a separate process, once per --max-batch value (1 turns micro-batching off).
+The client keeps --connections HTTP/1.1 keep-alive connections busy for --seconds, each posting a JSON array of
+--symbols symbols to /symbols as soon as the last answer arrived; a share of the lists (--fraction) hold a text
+date or an old symbol, as in synthetic.py. Reported are requests and symbols per second, latency percentiles and
+the batches the service made, from its /metrics. Needs uvicorn.
+
+    python benchmarks/bench_service.py --connections 64 --symbols 5 --max-batch 1 256
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+import date_gene_reference as gene_reference
+import synthetic
+
+
+def serve(port, max_batch, max_delay):
+    import uvicorn
+    import date_gene_service as service
+
+    app = service.ConversionService(max_batch=max_batch, max_delay=max_delay if max_batch > 1 else 0)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def bodies(count, symbols, fraction, seed=0):
+    """count JSON bodies of symbols symbols each; fraction of them hold one label that needs converting."""
+    rng = np.random.default_rng(seed)
+    genes = synthetic.gene_symbols(count * symbols, rng).reshape(count, symbols)
+    previous = gene_reference.default_index().table["Previous Symbol"].dropna().to_numpy(dtype=object)
+    special = rng.random(count) < fraction
+    genes[special, 0] = [rng.choice(synthetic.TEXT_DATES) if rng.random() < 0.5 else rng.choice(previous)
+                         for _ in range(special.sum())]
+    return [json.dumps(list(row)).encode() for row in genes]
+
+
+async def request(reader, writer, method, path, body=b""):
+    writer.write(f"{method} {path} HTTP/1.1\r\nhost: localhost\r\ncontent-type: application/json\r\n"
+                 f"content-length: {len(body)}\r\n\r\n".encode() + body)
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = next(int(line.split(b":")[1]) for line in head.split(b"\r\n") if line.lower().startswith(b"content-length"))
+    return status, await reader.readexactly(length)
+
+
+async def client(port, payloads, connections, seconds):
+    latencies, failures = [], 0
+    stop = time.perf_counter() + seconds
+
+    async def worker(offset):
+        nonlocal failures
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        at = offset
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, "POST", "/symbols", payloads[at % len(payloads)])
+            latencies.append(time.perf_counter() - start)
+            failures += status != 200
+            at += connections
+        writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(connections)))
+    elapsed = time.perf_counter() - started
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    metrics = json.loads((await request(reader, writer, "GET", "/metrics"))[1])
+    writer.close()
+    return latencies, failures, elapsed, metrics
+
+
+async def wait_for(port, process, timeout=60):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("the service exited before it answered")
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            status, _ = await request(reader, writer, "GET", "/health")
+            writer.close()
+            if status == 200:
+                return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("the service did not start")
+
+
+def run(max_batch, args, payloads):
+    port = free_port()
+    command = [sys.executable, os.path.abspath(__file__), "--serve", str(port), str(max_batch), str(args.max_delay)]
+    process = subprocess.Popen(command)
+    try:
+        asyncio.run(wait_for(port, process))
+        asyncio.run(client(port, payloads, args.connections, 0.5))  # warm up
+        latencies, failures, elapsed, metrics = asyncio.run(client(port, payloads, args.connections, args.seconds))
+    finally:
+        process.terminate()
+        process.wait()
+    latencies = np.array(latencies) * 1000
+    done = len(latencies)
+    batched = metrics["batched_requests"]
+    return {"max_batch": max_batch, "requests_per_second": done / elapsed,
+            "symbols_per_second": done * args.symbols / elapsed, "p50_ms": np.percentile(latencies, 50),
+            "p99_ms": np.percentile(latencies, 99), "failures": failures,
+            "mean_batch": batched / metrics["batches"] if metrics["batches"] else 0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, default=64)
+    parser.add_argument("--symbols", type=int, default=5, help="symbols per request")
+    parser.add_argument("--fraction", type=float, default=0.05, help="share of requests with a label to convert")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--max-batch", type=int, nargs="+", default=[1, 256])
+    parser.add_argument("--max-delay", type=float, default=0.002)
+    parser.add_argument("-o", "--output", help="write the results here as JSON")
+    parser.add_argument("--serve", nargs=3, metavar=("PORT", "MAX_BATCH", "MAX_DELAY"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(int(args.serve[0]), int(args.serve[1]), float(args.serve[2]))
+        return
+
+    payloads = bodies(10000, args.symbols, args.fraction)
+    results = []
+    for max_batch in args.max_batch:
+        result = run(max_batch, args, payloads)
+        results.append(result)
+        print(f"max_batch {max_batch:>5}: {result['requests_per_second']:9.0f} requests/s  "
+              f"{result['symbols_per_second']:9.0f} symbols/s  p50 {result['p50_ms']:6.1f} ms  "
+              f"p99 {result['p99_ms']:6.1f} ms  mean batch {result['mean_batch']:6.1f}  "
+              f"failures {result['failures']}", flush=True)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=1)
+
+
+if __name__ == "__main__":
+    main()
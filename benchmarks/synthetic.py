@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Synthetic gene expression matrices for the benchmarks.
+
+make_dataset() builds a dataframe laid out like the files users upload: gene names as the index, a gene
+description column, then value columns. The names are HGNC-like symbols (ZNF217, SLC25A3, LOC100287934, ...) mixed
+with the labels each conversion path looks for. As the engine handles a file as all-or-none, kind picks one path:
+  clean        symbols only
+  old_symbols  previous symbols from the reference table (DEC1, MARCH1, SEPT9, ...)
+  dates        text dates as Excel writes them (Mar-01, 1-Mar, SEP-02, ...), with a duplicated Mar-01/Mar-02 pair
+  numeric      numeric dates (2021-03-01, ...) in the yyyy-mm-dd layout, with a duplicated Mar-01/Mar-02 pair
+A mix gives the share of each category of labels (text_dates, numeric_dates, old_symbols) instead, and march
+the number of duplicated Mar-01/Mar-02 rows; the engine then takes the first path that applies to the file.
+
+    python benchmarks/synthetic.py --rows 100000 --columns 50 --kind dates -o dates_100k.csv
+    python benchmarks/synthetic.py --rows 100000 --mix text_dates=0.02 old_symbols=0.001 --march 6 -o mixed.csv
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import date_gene_engine as engine
+import date_gene_reference as gene_reference
+
+KINDS = ("clean", "old_symbols", "dates", "numeric")
+CATEGORIES = ("text_dates", "numeric_dates", "old_symbols")  # labels a mix can hold
+KIND_MIX = {"old_symbols": "old_symbols", "dates": "text_dates", "numeric": "numeric_dates"}
+PREFIXES = ["ZNF", "SLC", "KRT", "RPL", "RPS", "OR", "TMEM", "CCDC", "FAM", "ANKRD", "LRRC", "PCDH", "CD", "IL", "KLF",
+            "SOX", "HOXA", "TBC1D", "WDR", "ZBTB", "CYP", "ADAM", "COL", "ATP", "NDUFA", "PRR", "C1ORF", "DNAJ", "RAB",
+            "USP", "KIF", "MYO", "GPR", "TRIM", "PPP1R", "SNORD", "MIR", "LINC", "H2BC", "PSMA"]
+SUFFIXES = ["", "A", "B", "C"]
+# the dates Excel makes of gene names, in the forms it writes them
+TEXT_DATES = [f"{m}-{d:02d}" for m, days in [("Mar", range(3, 12)), ("Sep", range(1, 16)), ("Dec", [1])] for d in days]
+TEXT_DATES += [f"{d}-{m}" for m, days in [("Mar", range(3, 12)), ("Sep", range(1, 16))] for d in days]
+TEXT_DATES += ["SEPT-1", "Sep-4", "APR-11", "Oct-07"]
+
+
+def gene_symbols(count, rng):
+    """count distinct HGNC-like symbols: family prefixes with numbers, then LOC ids once those run out."""
+    numbers = np.arange(1, 1000)
+    pool = np.array([f"{p}{n}{s}" for p in PREFIXES for n in numbers for s in SUFFIXES], dtype=object)
+    rng.shuffle(pool)
+    loc = np.array([f"LOC{100000000 + i}" for i in range(max(count - len(pool), 0))], dtype=object)
+    return np.concatenate([pool[:count], loc])
+
+
+def march_rows(count, numeric):
+    """count Mar-01/Mar-02 labels, two of each date in turn, and their descriptions. Only the first two rows of a
+    date describe its genes (MTARC1, then MARCHF1); the engine leaves any further ones without a gene."""
+    labels, names = [], []
+    for i in range(count):
+        date, nth = 1 + i // 2 % 2, i % 2 + i // 4 * 2
+        genes = ["MTARC1", "MARCHF1"] if date == 1 else ["MTARC2", "MARCHF2"]
+        labels.append(f"2021-03-0{date}" if numeric else f"Mar-0{date}")
+        names.append(engine.MARCH_NAMES[genes[nth]] if nth < 2 else "")
+    return labels, names
+
+
+def parse_mix(items):
+    """{category: share} from command-line items such as text_dates=0.01."""
+    mix = {}
+    for item in items:
+        category, _, share = item.partition("=")
+        if category not in CATEGORIES:
+            raise ValueError(f"mix categories are {CATEGORIES}, not {category!r}")
+        mix[category] = float(share)
+    return mix
+
+
+def make_dataset(rows, columns=1, kind="dates", fraction=0.01, seed=0, reference=None, mix=None, march=None):
+    """Synthetic dataframe of rows genes and columns value columns.
+
+    mix is {category: share of the genes} for the CATEGORIES; without it, fraction of the genes are labels of the
+    given kind. Every category with a share gets at least one label. march duplicated Mar-01/Mar-02 rows are added
+    on top, as numeric dates when the mix has numeric but no text dates (default: one Mar-01 and one Mar-02 pair
+    when there are dates, none otherwise).
+    """
+    if mix is None:
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {KINDS}")
+        mix = {KIND_MIX[kind]: fraction} if kind in KIND_MIX else {}
+    if not set(mix) <= set(CATEGORIES):
+        raise ValueError(f"mix categories are {CATEGORIES}")
+    mix = {category: share for category, share in mix.items() if share > 0}
+    if march is None:
+        march = 4 if {"text_dates", "numeric_dates"} & set(mix) else 0
+    rng = np.random.default_rng(seed)
+    genes = gene_symbols(rows, rng)
+    descriptions = np.array([f"synthetic gene {g.lower()}" for g in genes], dtype=object)
+
+    labels, names = march_rows(march, "numeric_dates" in mix and "text_dates" not in mix)
+    for category, share in mix.items():
+        special = max(int(rows * share), 1)
+        if category == "old_symbols":
+            table = (reference or gene_reference.default_index()).table
+            previous = rng.choice(table["Previous Symbol"].dropna().to_numpy(dtype=object), special)
+            labels += list(previous)
+            names += [f"previous symbol of {s.lower()}" for s in previous]
+            continue
+        if category == "numeric_dates":
+            days = rng.integers(3, 12, special)
+            labels += [f"2021-{m:02d}-{d:02d}" for m, d in zip(rng.choice([3, 9], special), days)]
+        else:
+            labels += list(rng.choice(TEXT_DATES, special))
+        names += [""] * special
+    if labels:
+        at = rng.choice(rows, min(len(labels), rows), replace=False)
+        genes[at] = labels[:len(at)]
+        descriptions[at] = names[:len(at)]
+
+    values = rng.random((rows, columns), dtype=np.float32) * 10
+    df = pd.DataFrame(values, columns=[f"Sample {i + 1}" for i in range(columns)])
+    df.insert(0, "Description", descriptions)
+    df.index = pd.Index(genes, name="Gene")
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--columns", type=int, default=1)
+    parser.add_argument("--kind", choices=KINDS, default="dates")
+    parser.add_argument("--fraction", type=float, default=0.01, help="share of genes that are dates or old symbols")
+    parser.add_argument("--mix", nargs="+", metavar="CATEGORY=SHARE",
+                        help=f"share of each of {', '.join(CATEGORIES)} instead of --kind and --fraction")
+    parser.add_argument("--march", type=int, help="duplicated Mar-01/Mar-02 rows (default: 4 when there are dates)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", required=True, help="CSV file to write")
+    args = parser.parse_args(argv)
+    try:
+        mix = parse_mix(args.mix) if args.mix else None
+    except ValueError as error:
+        parser.error(str(error))
+    df = make_dataset(args.rows, args.columns, args.kind, args.fraction, args.seed, mix=mix, march=args.march)
+    df.to_csv(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Batch conversion of many gene files over a process pool.
+
+convert_files() sends one file to each task. Every worker loads the HGNC reference once when it starts and
+builds its own Mar-01/Mar-02 corrections per file, so nothing is shared between files. Results come back as
+BatchResult objects in the order of the inputs; a file that fails is reported, not raised, so one bad file
+does not stop the batch.
+"""
+
+import os
+import tracemalloc
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+import pandas as pd
+
+import date_gene_engine as engine
+import date_gene_io as gene_io
+import date_gene_reference as gene_reference
+
+
+@dataclass
+class BatchResult:
+    name: str  # file name without the extension of its format
+    source: str
+    output: Optional[str] = None  # where the cleaned file was written, if it was
+    report: Optional[engine.ConversionReport] = None
+    cleaned: Optional[pd.DataFrame] = None  # only when the file was converted in memory and not written
+    error: Optional[str] = None
+
+
+def _reference(hgnc):
+    return gene_reference.hgnc_index(hgnc) if hgnc else gene_reference.default_index()
+
+
+def _init_worker(hgnc, profile=False):
+    _reference(hgnc)  # load (or memory-map) the reference once per worker, before the first file arrives
+    if profile and not tracemalloc.is_tracing():
+        tracemalloc.start()  # lets every stage of the reports record its peak memory
+
+
+def output_path(path, output_dir=None):
+    """cleaned_<file name> in output_dir, or next to path when output_dir is None."""
+    return os.path.join(output_dir or os.path.dirname(os.path.abspath(path)), "cleaned_" + os.path.basename(path))
+
+
+def output_paths(paths, output_dir=None):
+    """output_path() of every path; raises ValueError when two inputs would be written to the same file, as
+    a/x.csv and b/x.csv are with one output_dir."""
+    outputs = [output_path(p, output_dir) for p in paths]
+    seen = {}
+    for path, output in zip(paths, outputs):
+        seen.setdefault(os.path.normcase(os.path.abspath(output)), []).append(path)
+    clashes = [sources for sources in seen.values() if len(sources) > 1]
+    if clashes:
+        raise ValueError("these inputs would overwrite each other's output: "
+                         + "; ".join(", ".join(sources) for sources in clashes))
+    return outputs
+
+
+def convert_file(path, output=None, options=None, hgnc=None, stream=False):
+    """Convert one file; write it to output, in the format its name gives, when given. Runs in the worker
+    processes. The format of path is detected from its first bytes and full extension; a .txt output keeps the
+    separator of its input."""
+    name = gene_io.stem(path)
+    try:
+        reference = _reference(hgnc)
+        fmt = gene_io.detect_format(path)
+        if fmt is None:
+            raise ValueError(f"{path} is not a CSV/TSV, Parquet, Feather or xlsx file")
+        report = engine.ConversionReport()
+        if stream:
+            if fmt.kind in gene_io.COLUMNAR_FORMATS:
+                gene_io.convert_columnar_chunked(path, output, fmt.kind, options, reference, report=report)
+            elif fmt.kind in gene_io.TEXT_FORMATS:
+                gene_io.convert_csv_chunked(path, output, options, reference, sep=fmt.sep, report=report)
+            else:
+                raise ValueError(f"{fmt.kind} files cannot be streamed")
+            return BatchResult(name, path, output=output, report=report)
+        with report.stage("read"):
+            df = gene_io.read_table(path, fmt)
+        cleaned, report = engine.convert(df, options, reference, report)
+        if output is None:
+            return BatchResult(name, path, report=report, cleaned=cleaned)
+        with report.stage("export", len(cleaned)):
+            out_format = None if gene_io.sniffs_separator(output) else gene_io.format_from_name(output)
+            gene_io.write_table(cleaned, output, out_format or fmt)
+        return BatchResult(name, path, output=output, report=report)
+    except Exception:
+        return BatchResult(name, path, error=traceback.format_exc(limit=3))
+
+
+def convert_files(paths, output_dir=None, options=None, workers=None, hgnc=None, stream=False, write=True,
+                  profile=False):
+    """Convert every file in paths with up to workers processes (default: all cores).
+
+    options is one ConversionOptions for all files, or a dict of them keyed by path. With write=False the
+    cleaned dataframes are returned in the results instead of being written; stream=True converts each file
+    with date_gene_io.convert_csv_chunked, or convert_columnar_chunked for Parquet and Feather, which needs
+    write=True. hgnc is the path of a hgnc_complete_set.txt to use instead of the default reference.
+    profile=True traces memory allocations in every worker, so the stages of each report also record their
+    peak memory (at some cost in speed). Inputs whose outputs would overwrite each other raise ValueError
+    before any file is converted.
+    """
+    paths = list(paths)
+    if stream and not write:
+        raise ValueError("stream=True writes its output as it goes, so it needs write=True")
+    per_file = options if isinstance(options, dict) else {p: options for p in paths}
+    outputs = output_paths(paths, output_dir) if write else [None] * len(paths)
+    tasks = [(p, output, per_file.get(p), hgnc, stream) for p, output in zip(paths, outputs)]
+    if output_dir and write:
+        os.makedirs(output_dir, exist_ok=True)
+
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+    if workers == 1:  # no pool for a single worker, which keeps tracebacks and debuggers simple
+        started = profile and not tracemalloc.is_tracing()
+        _init_worker(hgnc, profile)
+        try:
+            return [convert_file(*task) for task in tasks]
+        finally:
+            if started:
+                tracemalloc.stop()
+    _reference(hgnc)  # builds a missing or stale HGNC cache here, once, instead of in every worker at the same time
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(hgnc, profile)) as pool:
+        futures = [pool.submit(convert_file, *task) for task in tasks]
+        return [future.result() for future in futures]
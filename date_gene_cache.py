@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Cache of converted files for the Gene Updater tool.
+
+Streamlit reruns the whole script on every widget change, and users upload the same file again. ConversionCache
+keeps the results of engine.convert() keyed by a hash of the input dataframe, the version of the reference
+index and the conversion options, so a rerun with unchanged choices is a lookup. Entries are evicted least
+recently used first once their total size passes max_bytes; with a directory, results are also pickled to
+disk, where they outlive the process and entries evicted from memory.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import asdict
+from functools import lru_cache
+
+import pandas as pd
+
+import date_gene_engine as engine
+import date_gene_reference as gene_reference
+
+
+CACHE_ENV = "GENE_UPDATER_CACHE_DIR"  # directory for the on-disk tier of the default cache
+MAX_BYTES = 512 << 20
+MAX_DISK_BYTES = 4 << 30
+CACHE_FORMAT = 3  # bump when the pickled results change shape
+
+
+def frame_digest(df):
+    """Hash of the labels, column names, dtypes and values of df."""
+    digest = hashlib.sha256()
+    digest.update(repr((df.shape, list(df.columns), [str(t) for t in df.dtypes], df.index.name)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def conversion_key(df, options, reference):
+    """Cache key of converting df with options and reference."""
+    choices = json.dumps(asdict(options), sort_keys=True, default=str)
+    parts = [str(CACHE_FORMAT), frame_digest(df), reference.version, choices]
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+def _size(cleaned):
+    return int(cleaned.memory_usage(index=True, deep=True).sum())
+
+
+class ConversionCache:
+    """LRU cache of (cleaned, report) results, capped at max_bytes in memory and max_disk_bytes on disk.
+
+    One cache can be shared by every session and thread of a process. Cached dataframes and reports are
+    shared between callers too, so treat them as read-only.
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES, directory=None, max_disk_bytes=MAX_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()  # key -> (cleaned, report, size), least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def _remember(self, key, cleaned, report):
+        size = _size(cleaned)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[2]
+            self._entries[key] = (cleaned, report, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1][2]
+
+    def _load(self, key):
+        try:
+            with open(self._path(key), "rb") as fp:
+                cleaned, report = pickle.load(fp)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+        os.utime(self._path(key))  # the modification time doubles as the last use of the disk tier
+        return cleaned, report
+
+    def _store(self, key, cleaned, report):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fp:
+            pickle.dump((cleaned, report), fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._path(key))  # readers never see a half-written entry
+        self._trim_disk()
+
+    def _trim_disk(self):
+        files = [e for e in os.scandir(self.directory) if e.name.endswith(".pkl")]
+        stats = sorted(((e.stat().st_mtime, e.stat().st_size, e.path) for e in files))
+        total = sum(size for _, size, _ in stats)
+        for _, size, path in stats:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:  # removed by another process already
+                pass
+            total -= size
+
+    def get(self, key):
+        """(cleaned, report) for key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], entry[1]
+        loaded = self._load(key) if self.directory else None
+        if loaded is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(key, *loaded)
+        return loaded
+
+    def put(self, key, cleaned, report):
+        self._remember(key, cleaned, report)
+        if self.directory:
+            self._store(key, cleaned, report)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def convert(self, df, options=None, reference=None):
+        """engine.convert(df, options, reference), answered from the cache when the same input was converted before."""
+        options = options or engine.ConversionOptions()
+        reference = gene_reference.default_index() if reference is None else reference
+        key = conversion_key(df, options, reference)
+        found = self.get(key)
+        if found is not None:
+            return found
+        cleaned, report = engine.convert(df, options, reference)
+        self.put(key, cleaned, report)
+        return cleaned, report
+
+
+@lru_cache(maxsize=None)
+def default_cache():
+    """The cache shared by every session of the process, with a disk tier in $GENE_UPDATER_CACHE_DIR if set."""
+    return ConversionCache(directory=os.environ.get(CACHE_ENV))
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Command-line batch entry point for the Gene Updater tool.
+
+    python date_gene_cli.py data/*.csv more_data/ -o cleaned --mar-resolution description --workers 8
+
+Inputs may be files, directories (every CSV/TSV, Parquet or Feather file directly inside them, including
+compressed .csv.gz/.tsv.zst files) or glob patterns. Each cleaned file is written as cleaned_<name>, in the format
+of its input, into --output-dir, or next to its input when no directory is given.
+The Mar-01/Mar-02 choice that the web tool asks for with select boxes is made by --mar-resolution instead:
+  description  match the gene description in the second column against the HGNC approved names (default);
+               pairs that do not match clearly fall back to the order and are listed for review
+  order        the first Mar-01/Mar-02 row gets --mar01-first/--mar02-first, the second row the other gene
+  mapping      read numbered labels and their genes (e.g. MAR-01_1st,MARCHF1) from the --mapping CSV
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+
+import pandas as pd
+
+import date_gene_batch as batch
+import date_gene_engine as engine
+import date_gene_io as gene_io
+
+
+INPUT_FORMATS = (*gene_io.TEXT_FORMATS, *gene_io.COLUMNAR_FORMATS)
+
+
+def _is_input(name):
+    found = gene_io.format_from_name(name)
+    return found is not None and found.kind in INPUT_FORMATS
+
+
+def expand_inputs(inputs):
+    """Files named by inputs, in order and without repeats. Earlier outputs (cleaned_*) found in a directory or by
+    a glob pattern are skipped."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths += sorted(os.path.join(item, f) for f in os.listdir(item)
+                            if _is_input(f) and not f.startswith("cleaned_"))
+        elif glob.has_magic(item):
+            paths += sorted(p for p in glob.glob(item, recursive=True)
+                            if not os.path.basename(p).startswith("cleaned_"))
+        else:
+            paths.append(item)
+    return list(dict.fromkeys(paths))
+
+
+def read_mapping(path):
+    """{numbered label: gene} from a CSV with the columns label and gene."""
+    mapping = pd.read_csv(path, dtype=str)
+    if not {"label", "gene"} <= set(mapping.columns):
+        raise ValueError(f"{path} needs the columns label and gene")
+    return dict(zip(mapping["label"].str.strip(), mapping["gene"].str.strip()))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="date_gene_cli", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", help="write cleaned files here instead of next to the inputs")
+    parser.add_argument("--mar-resolution", choices=engine.MAR_RESOLUTIONS, default="description")
+    parser.add_argument("--mar01-first", choices=list(engine.MAR01_GENES), default="MTARC1")
+    parser.add_argument("--mar02-first", choices=list(engine.MAR02_GENES), default="MTARC2")
+    parser.add_argument("--mapping", help="CSV of label,gene pairs for --mar-resolution mapping")
+    parser.add_argument("--date-format", choices=[engine.AUTO_DATE_FORMAT, *engine.DATE_FORMATS],
+                        default=engine.AUTO_DATE_FORMAT,
+                        help="layout of numeric dates; auto picks the only layout that fits every date, else yyyy-dd-mm")
+    parser.add_argument("--date-info", choices=list(engine.DATE_INFO), default="month-day",
+                        help="read numeric dates back as month-day or month-year")
+    parser.add_argument("--keep-order", action="store_true",
+                        help="keep the rows in their original order instead of sorting them by gene")
+    parser.add_argument("--duplicates", choices=engine.DUPLICATE_STRATEGIES, default="keep",
+                        help="merge rows that end up with the same gene: keep them all, keep the first or last, or "
+                             "sum/mean/max/min their values")
+    parser.add_argument("--workers", type=int, default=None, help="processes to use (default: all cores)")
+    parser.add_argument("--hgnc", help="hgnc_complete_set.txt to use instead of the curated reference")
+    parser.add_argument("--stream", action="store_true",
+                        help="convert CSV/TSV, Parquet and Feather files in chunks without loading them; rows keep "
+                             "their order and are not sorted")
+    parser.add_argument("--report", help="write what was changed in each file, and how long each stage took, to this "
+                                         ".json or .csv file")
+    parser.add_argument("--profile", action="store_true",
+                        help="also record the peak memory of each stage in --report (slower)")
+    return parser
+
+
+def write_reports(results, path):
+    """The reports of results as JSON (one object per file) or, for a .csv path, as one long table."""
+    done = [r for r in results if r.report is not None]
+    if path.lower().endswith(".csv"):
+        frames = [r.report.to_frame().assign(source=r.source) for r in done]
+        table = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["source"])
+        table[["source"] + [c for c in table.columns if c != "source"]].to_csv(path, index=False)
+    else:
+        with open(path, "w") as fp:
+            json.dump([dict(source=r.source, output=r.output, **r.report.to_dict()) for r in done], fp, indent=1)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.mar_resolution == "mapping" and not args.mapping:
+        parser.error("--mar-resolution mapping needs --mapping")
+    if args.stream and args.duplicates != "keep":
+        parser.error("--stream writes rows as they are read, so it cannot merge --duplicates")
+
+    options = engine.ConversionOptions(mar01_first=args.mar01_first, mar02_first=args.mar02_first,
+                                       date_format=args.date_format, date_info=args.date_info,
+                                       mar_resolution=args.mar_resolution, duplicates=args.duplicates,
+                                       row_order="original" if args.keep_order else "sorted",
+                                       mar_mapping=read_mapping(args.mapping) if args.mapping else {})
+    paths = expand_inputs(args.inputs)
+    if len(paths) == 0:
+        parser.error("no input files found")
+
+    try:
+        batch.output_paths(paths, args.output_dir)
+    except ValueError as error:
+        parser.error(f"{error}; convert them into separate --output-dir directories")
+
+    failed = 0
+    results = batch.convert_files(paths, output_dir=args.output_dir, options=options, workers=args.workers,
+                                  hgnc=args.hgnc, stream=args.stream, profile=args.profile)
+    for result in results:
+        if result.error:
+            failed += 1
+            print(f"{result.source}: failed\n{result.error}", file=sys.stderr)
+        else:
+            print(f"{result.source}: {result.report.status} -> {result.output}")
+            if result.report.needs_review:
+                print(f"{result.source}: gene description did not decide {', '.join(result.report.needs_review)};"
+                      " used the --mar01-first/--mar02-first order", file=sys.stderr)
+            for label, genes in result.report.ambiguous.items():
+                print(f"{result.source}: {label} is a previous symbol of {', '.join(genes)}; left as it is",
+                      file=sys.stderr)
+    if args.report:
+        write_reports(results, args.report)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,829 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Headless conversion engine for the Gene Updater tool.
+
+Everything here is free of Streamlit and of module-level mutable state, so the same
+functions back the web tool, batch jobs and worker pools. The entry point is
+convert(df, options), which returns the cleaned dataframe together with a ConversionReport.
+"""
+
+import json
+import re
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass, field
+from difflib import SequenceMatcher
+from functools import lru_cache
+from itertools import compress, permutations
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+import inflect
+
+from date_gene_reference import default_index
+
+
+########################################### Patterns and fixed tables ##############################################
+DATE_REGEX = re.compile("^Mar-|^Apr-|^Sept?-|^Oct-|^Dec-", flags=re.I)  # text dates, e.g. Mar-01 or SEP-1
+MARCH_REGEX = re.compile("^Mar-0?1|^0?1-Mar|^Mar-0?2|^0?2-Mar", flags=re.I)  # only the ambiguous march genes
+NUMDATE_REGEX = re.compile(r"^\d*[-/]?\W", flags=re.I)  # numeric dates, e.g. 2001-03-09
+# one pass over the index both detects text dates and splits them for normalisation: the month word, the first run
+# of digits and whatever follows it (only needed to know whether the label already holds a zero-padded number)
+DATE_PARTS = re.compile("^(?P<month>Mar|Apr|Sept?|Oct|Dec)-[^0-9]*(?P<day>[0-9]*)(?P<rest>.*)$", flags=re.I | re.S)
+DATE_SCAN = re.compile("^(?:Mar|Apr|Sept?|Oct|Dec)-", flags=re.I | re.M)  # DATE_REGEX over newline-joined labels
+MAR01_REGEX = re.compile("Mar-0?1_1st|0?1-Mar_1st|Mar-0?1_2nd|0?1-Mar_2nd", flags=re.I)
+MAR02_REGEX = re.compile("Mar-0?2_1st|0?2-Mar_1st|Mar-0?2_2nd|0?2-Mar_2nd", flags=re.I)
+
+# the three numbers of a numeric date, separated by -, / or ., with an optional time that spreadsheets append
+NUMDATE_PARTS = re.compile(r"^\s*(\d{1,4})[-/.](\d{1,4})[-/.](\d{1,4})(?:[ T][0-9:.]*)?\s*$")
+# position of the year, month and day among those numbers for each numeric date layout
+DATE_FORMATS = {"yyyy-dd-mm": (0, 2, 1), "yyyy-mm-dd": (0, 1, 2), "dd-mm-yyyy": (2, 1, 0), "mm-dd-yyyy": (2, 0, 1)}
+DATE_INFO = {"month-year": "%b-%y", "month-day": "%b-%d"}
+AUTO_DATE_FORMAT = "auto"  # date_format that picks the only layout valid for every numeric date
+MONTHS = np.array(["", "Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"], dtype=object)
+MONTH_DAYS = np.array([0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+# for each ambiguous date, the gene assigned to the first occurrence decides the gene of the second
+MAR01_GENES = {"MTARC1": "MARCHF1", "MARCHF1": "MTARC1"}
+MAR02_GENES = {"MTARC2": "MARCHF2", "MARCHF2": "MTARC2"}
+MAR_RESOLUTIONS = ("order", "description", "mapping")
+# stages of a conversion, in the order they run; read and export are timed by the callers that do the file I/O
+STAGES = ("read", "detect", "normalize", "resolve", "rename", "sort", "dedupe", "export")
+ROW_ORDERS = ("sorted", "original")
+DUPLICATE_STRATEGIES = ("keep", "first", "last", "sum", "mean", "max", "min")
+# HGNC approved names of the ambiguous genes, used when the reference table does not list them
+MARCH_NAMES = {"MTARC1": "mitochondrial amidoxime reducing component 1", "MARCHF1": "membrane associated ring-CH-type finger 1",
+               "MTARC2": "mitochondrial amidoxime reducing component 2", "MARCHF2": "membrane associated ring-CH-type finger 2"}
+# descriptions decide a Mar-01/Mar-02 pair only if one of them matches its gene at least this well, and the chosen
+# assignment beats the swapped one by at least MIN_NAME_MARGIN per row
+MIN_NAME_SCORE = 0.6
+MIN_NAME_MARGIN = 0.15
+
+CORRECTED = {"DEC-01_1st": "DELEC1", "01-DEC_1st":"DELEC1", "MAR-03_1st": "MARCHF3", "03-MAR_1st":"MARCHF3",
+             "MAR-04_1st": "MARCHF4", "04-MAR_1st":"MARCHF4", "MAR-05_1st": "MARCHF5", "05-MAR_1st":"MARCHF5",
+             "MAR-06_1st": "MARCHF6", "06-MAR_1st":"MARCHF6", "MAR-07_1st": "MARCHF7", "07-MAR_1st":"MARCHF7",
+             "MAR-08_1st": "MARCHF8", "08-MAR_1st":"MARCHF8", "MAR-09_1st": "MARCHF9", "09-MAR_1st":"MARCHF9",
+             "MAR-10_1st": "MARCHF10", "10-MAR_1st":"MARCHF10", "MAR-11_1st": "MARCHF11", "11-MAR_1st":"MARCHF11",
+             "SEP-15_1st": "SELENOF", "15_SEP_1st":"SELENOF", "SEP-01_1st": "SEPTIN1", "01-SEP_1st":"SEPTIN1",
+             "SEP-02_1st": "SEPTIN2", "02-SEP_1st":"SEPTIN2", "SEP-03_1st": "SEPTIN3", "03-SEP_1st":"SEPTIN3",
+             "SEP-04_1st": "SEPTIN4", "04-SEP_1st":"SEPTIN4", "SEP-05_1st": "SEPTIN5", "05-SEP_1st":"SEPTIN5",
+             "SEP-06_1st": "SEPTIN6", "06-SEP_1st":"SEPTIN6", "SEP-07_1st": "SEPTIN7", "07-SEP_1st":"SEPTIN7",
+             "SEP-08_1st": "SEPTIN8", "08-SEP_1st":"SEPTIN8", "SEP-09_1st": "SEPTIN9", "09-SEP_1st":"SEPTIN9",
+             "SEP-10_1st": "SEPTIN10", "10-SEP_1st":"SEPTIN10", "SEP-11_1st": "SEPTIN11", "11-SEP_1st":"SEPTIN11",
+             "SEP-12_1st": "SEPTIN12", "12-SEP_1st":"SEPTIN12", "SEP-13_1st":"SEPTIN7P2", "13-SEP_1st":"SEPTIN7P2",
+             "SEP-14_1st": "SEPTIN14", "14-SEP_1st":"SEPTIN14",
+
+             "Dec-01_1st": "DELEC1", "01-Dec_1st":"DELEC1", "Mar-03_1st": "MARCHF3", "03-Mar_1st":"MARCHF3",
+             "Mar-04_1st": "MARCHF4", "04-Mar_1st":"MARCHF4", "Mar-05_1st": "MARCHF5", "05-Mar_1st":"MARCHF5",
+             "Mar-06_1st": "MARCHF6", "06-Mar_1st":"MARCHF6", "Mar-07_1st": "MARCHF7", "07-Mar_1st":"MARCHF7",
+             "Mar-08_1st": "MARCHF8", "08-Mar_1st":"MARCHF8", "Mar-09_1st": "MARCHF9", "09-Mar_1st":"MARCHF9",
+             "Mar-10_1st": "MARCHF10", "10-Mar_1st":"MARCHF10", "Mar-11_1st": "MARCHF11", "11-Mar_1st":"MARCHF11",
+             "Sep-15_1st": "SELENOF", "15_Sep_1st":"SELENOF", "Sep-01_1st": "SEPTIN1", "01-Sep_1st":"SEPTIN1",
+             "Sep-02_1st": "SEPTIN2", "02-Sep_1st":"SEPTIN2", "Sep-03_1st": "SEPTIN3", "03-Sep_1st":"SEPTIN3",
+             "Sep-04_1st": "SEPTIN4", "04-Sep_1st":"SEPTIN4", "Sep-05_1st": "SEPTIN5", "05-Sep_1st":"SEPTIN5",
+             "Sep-06_1st": "SEPTIN6", "06-Sep_1st":"SEPTIN6", "Sep-07_1st": "SEPTIN7", "07-Sep_1st":"SEPTIN7",
+             "Sep-08_1st": "SEPTIN8", "08-Sep_1st":"SEPTIN8", "Sep-09_1st": "SEPTIN9", "09-Sep_1st":"SEPTIN9",
+             "Sep-10_1st": "SEPTIN10", "10-Sep_1st":"SEPTIN10", "Sep-11_1st": "SEPTIN11", "11-Sep_1st":"SEPTIN11",
+             "Sep-12_1st": "SEPTIN12", "12-Sep_1st":"SEPTIN12", "Sep-13_1st":"SEPTIN7P2", "13-Sep_1st":"SEPTIN7P2",
+             "Sep-14_1st": "SEPTIN14", "14-Sep_1st":"SEPTIN14"
+                 }
+
+p = inflect.engine()
+
+
+########################################### Options and report ######################################################
+@dataclass
+class ConversionOptions:
+    """Choices that the web tool otherwise asks for through widgets."""
+    mar01_first: str = "MTARC1"  # gene for the first Mar-01 row; the second Mar-01 row gets the other one
+    mar02_first: str = "MTARC2"
+    date_format: str = "yyyy-dd-mm"  # layout of numeric dates, a key of DATE_FORMATS or AUTO_DATE_FORMAT
+    date_info: str = "month-day"  # how numeric dates are read back into gene names, a key of DATE_INFO
+    mar_resolution: str = "order"  # how Mar-01/Mar-02 rows get their genes, one of MAR_RESOLUTIONS
+    mar_mapping: dict = field(default_factory=dict)  # numbered label (e.g. MAR-01_1st) -> gene, for "mapping"
+    row_order: str = "sorted"  # "original" swaps a new index onto the rows as they are, see relabel_frame
+    duplicates: str = "keep"  # what to do with rows that end up with the same gene, one of DUPLICATE_STRATEGIES
+
+
+@dataclass
+class MarchChoice:
+    """How one Mar-01 or Mar-02 pair was matched to its genes from the gene descriptions."""
+    date: str  # "Mar-01" or "Mar-02"
+    labels: list  # numbered labels, e.g. ["MAR-01_1st", "MAR-01_2nd"]
+    genes: list  # best matching gene for each label
+    method: str  # how the best row matched: "exact", "symbol", "token", "fuzzy" or "numeral"; "none" without descriptions
+    score: float  # match of that row's description with its gene, 0 to 1
+    confidence: float  # how much better genes fits than the swapped assignment, per row
+    automatic: bool  # False when the match is too weak and the order (or a human) has to decide
+
+
+@dataclass
+class StageStats:
+    """Cost of one stage of a conversion. A stage that runs more than once (e.g. detect for numeric files) adds up."""
+    name: str  # one of STAGES
+    seconds: float = 0.0
+    rows: Optional[int] = None  # rows the stage worked on
+    peak_mb: Optional[float] = None  # peak traced memory during the stage, only while tracemalloc is tracing
+
+
+@dataclass
+class ConversionReport:
+    """What convert() found and changed in one dataframe."""
+    status: str = "clean"  # one of "clean", "old_symbols", "dates", "march", "numeric"
+    misidentified: list = field(default_factory=list)  # labels that were detected as dates or old symbols
+    numeric_dates: dict = field(default_factory=dict)  # numeric date -> text date, only for numeric files
+    date_format: str = None  # layout the numeric dates were read in, after "auto" is resolved
+    march_choices: list = field(default_factory=list)  # MarchChoice per pair, for mar_resolution="description"
+    rows_in: int = 0
+    rows_out: int = 0  # fewer than rows_in when repeated date rows were dropped
+    changes: dict = field(default_factory=dict)  # rule -> number of labels it changed, see _date_changes
+    missing: list = field(default_factory=list)  # labels whose row ended up as <NA>
+    ambiguous: dict = field(default_factory=dict)  # previous symbols of several genes, left as they are -> genes
+    stages: list = field(default_factory=list)  # StageStats in the order the stages first ran
+    hook: Optional[Callable] = field(default=None, repr=False, compare=False)  # called with each finished StageStats
+
+    @property
+    def needs_review(self):
+        """Mar-01/Mar-02 labels whose description did not decide their gene."""
+        return [label for choice in self.march_choices if not choice.automatic for label in choice.labels]
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Time the block as stage name (one of STAGES), which works on rows rows."""
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            stats = next((s for s in self.stages if s.name == name), None)
+            if stats is None:
+                stats = StageStats(name)
+                self.stages.append(stats)
+            stats.seconds += seconds
+            stats.rows = rows if rows is not None else stats.rows
+            if tracing:
+                stats.peak_mb = max(stats.peak_mb or 0.0, tracemalloc.get_traced_memory()[1] / 2 ** 20)
+            if self.hook is not None:
+                self.hook(StageStats(name, seconds, rows, stats.peak_mb))
+
+    def to_dict(self):
+        report = {f: getattr(self, f) for f in self.__dataclass_fields__ if f != "hook"}
+        report.update(march_choices=[asdict(c) for c in self.march_choices], stages=[asdict(s) for s in self.stages],
+                      needs_review=self.needs_review)
+        return report
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_frame(self):
+        """The stages, changes per rule, <NA> and ambiguous labels as one long table, e.g. for report.to_frame().to_csv()."""
+        records = [{"section": "stage", "name": s.name, "seconds": s.seconds, "rows": s.rows, "peak_mb": s.peak_mb}
+                   for s in self.stages]
+        records += [{"section": "change", "name": rule, "count": count} for rule, count in self.changes.items()]
+        records += [{"section": "missing", "name": label} for label in self.missing]
+        records += [{"section": "ambiguous", "name": label} for label in self.ambiguous]
+        return pd.DataFrame(records, columns=["section", "name", "seconds", "rows", "peak_mb", "count"])
+
+
+def _stage(report, name, rows=None):
+    return nullcontext() if report is None else report.stage(name, rows)
+
+
+def _changed(old, new):
+    """How many labels differ between old and new; missing labels on both sides are not a change."""
+    old, new = np.asarray(old, dtype=object), np.asarray(new, dtype=object)
+    return ((old != new) & ~(pd.isna(old) & pd.isna(new))).sum()
+
+
+def _count(report, rule, count):
+    if report is not None and count:
+        report.changes[rule] = report.changes.get(rule, 0) + int(count)
+
+
+############################################# Detection ############################################################
+def upper_labels(index):
+    """index read as upper-case text, as the tool compares labels in upper case."""
+    return index.astype(str, copy=False).str.upper()  # expand to format actual dates from excel sheets as text
+
+
+def prepare_index(df):
+    """Copy of df with the gene column read as upper-case text."""
+    df = df.copy()
+    df.index = upper_labels(df.index)
+    return df
+
+
+def _as_text(labels):
+    return pd.Series(labels, dtype=object)
+
+
+def _match_mask(labels, pattern):
+    return np.fromiter((pattern.match(g) is not None for g in map(str, labels)), dtype=bool, count=len(labels))
+
+
+def date_mask(labels):
+    """Boolean array marking the text dates among labels.
+
+    The labels are joined into one newline-separated string and scanned once with DATE_SCAN, so the regex
+    engine runs a single time over the whole index instead of once per label.
+    """
+    labels = list(map(str, labels))
+    text = "\n".join(labels)
+    if len(labels) == 0 or text.count("\n") != len(labels) - 1:  # a label holding a newline would shift the rows
+        return _match_mask(labels, DATE_REGEX)
+    lengths = np.fromiter(map(len, labels), dtype=np.int64, count=len(labels))
+    starts = np.concatenate(([0], np.cumsum(lengths + 1)[:-1]))
+    hits = np.fromiter((m.start() for m in DATE_SCAN.finditer(text)), dtype=np.int64)
+    mask = np.zeros(len(labels), dtype=bool)
+    mask[np.searchsorted(starts, hits)] = True
+    return mask
+
+
+def find_dates(labels):
+    labels = list(labels)
+    return list(compress(labels, date_mask(labels)))
+
+
+def find_march(labels):
+    labels = list(labels)
+    return list(compress(labels, _match_mask(labels, MARCH_REGEX)))
+
+
+def find_old_symbols(labels, reference):
+    return reference.find(labels, case_sensitive=False)  # labels are upper case, HGNC has e.g. C1orf112
+
+
+def find_ambiguous(labels, reference):
+    """{label: genes} for the previous symbols in labels that name several genes, which are never renamed."""
+    return reference.find_ambiguous(labels, case_sensitive=False)
+
+
+def find_numeric_dates(labels):
+    labels = list(labels)
+    return list(compress(labels, _match_mask(labels, NUMDATE_REGEX)))
+
+
+def classify(df, reference=None):
+    """Which path convert() takes for df: "dates", "march", "old_symbols", "numeric" or "clean".
+
+    A numeric file may still contain Mar-01/Mar-02 once its dates are read, see march_rows(). Only the index
+    is read, so no data column is copied.
+    """
+    reference = default_index() if reference is None else reference
+    return _classify(upper_labels(df.index).tolist(), reference)
+
+
+def _classify(labels, reference):
+    date_search = find_dates(labels)
+    if len(date_search) != 0:
+        return "march" if len(find_march(date_search)) != 0 else "dates"
+    elif len(find_old_symbols(labels, reference)) != 0:
+        return "old_symbols"
+    elif len(find_numeric_dates(labels)) != 0:
+        return "numeric"
+    return "clean"
+
+
+############################################ Resolvers #############################################################
+def date_parts(labels):
+    """month/day/rest columns for labels, extracted with DATE_PARTS in one pass. month is NaN for non-dates."""
+    return _as_text(labels).str.extract(DATE_PARTS)
+
+
+def format_dates(labels):
+    """Rewrite each date label as zero-padded Mon-DD, e.g. SEP-1 becomes SEP-01. Returns {label: Mon-DD}."""
+    labels = _as_text(labels).drop_duplicates()
+    parts = date_parts(labels)
+    day = parts["day"].fillna("")
+    # python time fmts only read zero-padded numbers, so single digits are padded unless two digits appear later on
+    pad = (day.str.len() == 1) & ~parts["rest"].fillna("").str.contains("[0-9]{2}")
+    formatted = parts["month"] + "-" + day.where(~pad, "0" + day)
+    keep = parts["month"].notna() & (day != "")  # a date without any number is left as it is
+    return dict(zip(labels[keep], formatted[keep]))
+
+
+def _ordinals(counts):
+    # inflect is slow per call, so only the distinct counts (1, 2, ...) are spelt out
+    return counts.map({n: p.ordinal(n) for n in counts.unique()})
+
+
+def _numbered(labels):
+    """labels with _1st, _2nd, ... appended, counting each label in order of appearance."""
+    labels = pd.Series(labels, dtype=object)
+    return labels + _ordinals(labels.groupby(labels).cumcount().add(1)).radd('_')
+
+
+def number_duplicates(df, date_search):
+    """Date rows of df renamed to Mon-DD_1st, Mon-DD_2nd, ... in order of appearance."""
+    found = df[df.index.isin(date_search)]
+    found = found.rename(index=format_dates(date_search))
+    index_name = found.index.name or "index"
+    found = found.rename_axis(index_name).reset_index(drop=False)
+    found = found.drop_duplicates()  # ensures that there aren't duplicate rows (row name and values both repeated)
+    found[index_name] = _numbered(found[index_name]).to_numpy()
+    return found.set_index(index_name)
+
+
+def _variants(label):
+    # the same numbered label as written for text dates (MAR-01_1st) and for parsed numeric dates (Mar-01_1st)
+    date, _, nth = label.partition("_")
+    return {label, f"{date.upper()}_{nth.lower()}", f"{date.capitalize()}_{nth.lower()}"}
+
+
+@lru_cache(maxsize=8)
+def march_names(reference):
+    """Approved name of each ambiguous gene, taken from reference where it lists them."""
+    names = dict(MARCH_NAMES)
+    table = reference.table
+    rows = table[table["Approved symbol"].isin(list(names))].drop_duplicates("Approved symbol")
+    names.update(zip(rows["Approved symbol"], rows["Approved name"]))
+    return names
+
+
+@lru_cache(maxsize=8)
+def march_symbols(reference):
+    """Lower-case current and previous symbols of each ambiguous gene, e.g. MARCHF1 -> {marchf1, march1}."""
+    table = reference.table
+    symbols = {gene: {gene.lower()} for gene in MARCH_NAMES}
+    for previous, gene in zip(table["Previous Symbol"], table["Approved symbol"]):
+        if gene in symbols:
+            symbols[gene].add(str(previous).lower())
+    return {gene: frozenset(s) for gene, s in symbols.items()}
+
+
+def _normalised(text):
+    return " ".join(re.findall("[a-z0-9]+", str(text).lower()))
+
+
+def _numeral(text):
+    found = re.search(r"\b([0-9]+)$", text)
+    return found and found.group(1)
+
+
+def name_score(description, name, symbols=frozenset()):
+    """(score, method) for how well a gene description matches an approved name: 1.0 for an exact match or
+    when the description names one of the gene's symbols, otherwise the better of the word overlap ("token")
+    and the difflib similarity ("fuzzy"). A description ending in another number than the name (finger 2 for
+    finger 1) scores 0 ("numeral"), as the names of the two candidate genes differ mostly in that number."""
+    a, b = _normalised(description), _normalised(name)
+    if a == b:
+        return 1.0, "exact"
+    if _numeral(a) and _numeral(a) != _numeral(b):
+        return 0.0, "numeral"
+    ta, tb = set(a.split()), set(b.split())
+    if ta & symbols:
+        return 1.0, "symbol"
+    token = len(ta & tb) / len(ta | tb) if ta | tb else 0.0
+    fuzzy = SequenceMatcher(None, a, b).ratio()
+    return (token, "token") if token >= fuzzy else (fuzzy, "fuzzy")
+
+
+def _march_pairs(numbered):
+    """(date, [numbered labels], candidate genes) of every Mar-01/Mar-02 pair in numbered; only the first two
+    rows of a date have a gene."""
+    pairs = []
+    for date, regex, genes in [("Mar-01", MAR01_REGEX, MAR01_GENES), ("Mar-02", MAR02_REGEX, MAR02_GENES)]:
+        labels = [label for label in numbered if regex.search(label)][:2]
+        if labels:
+            pairs.append((date, labels, genes))
+    return pairs
+
+
+def resolve_march(numbered, descriptions, reference=None):
+    """Match the description of each Mar-01/Mar-02 row against the approved names of its two candidate genes.
+
+    Returns ({label: gene} for the pairs that were decided, [MarchChoice for every pair]). A pair is decided
+    when one of its descriptions matches well (MIN_NAME_SCORE) and together they clearly favour one assignment
+    (MIN_NAME_MARGIN), unless a row would get a gene whose name ends in another number than its description.
+    """
+    reference = default_index() if reference is None else reference
+    names, symbols = march_names(reference), march_symbols(reference)
+    assignments, choices = {}, []
+    text = dict(zip(numbered, descriptions))
+    for date, labels, genes in _march_pairs(numbered):
+        rows = [(label, text.get(label, "")) for label in labels]  # a row without a description matches nothing
+        scores = {(label, gene): name_score(text, names[gene], symbols[gene]) for label, text in rows for gene in genes}
+        ranked = sorted(permutations(genes, len(rows)),
+                        key=lambda genes_: sum(scores[label, g][0] for (label, _), g in zip(rows, genes_)), reverse=True)
+        totals = [sum(scores[label, g][0] for (label, _), g in zip(rows, genes_)) for genes_ in ranked[:2]]
+        score, method = max(scores[label, g] for (label, _), g in zip(rows, ranked[0]))
+        confidence = (totals[0] - totals[1]) / len(rows)
+        wrong_gene = any(scores[label, g][1] == "numeral" for (label, _), g in zip(rows, ranked[0]))
+        choice = MarchChoice(date, [label for label, _ in rows], list(ranked[0]), method, round(score, 3),
+                             round(confidence, 3),
+                             score >= MIN_NAME_SCORE and confidence >= MIN_NAME_MARGIN and not wrong_gene)
+        if choice.automatic:
+            assignments.update(zip(choice.labels, choice.genes))
+        choices.append(choice)
+    return assignments, choices
+
+
+def march_corrections(options, numbered=(), descriptions=None, reference=None):
+    """CORRECTED plus the Mar-01/Mar-02 assignments from options, and the MarchChoice list behind them.
+
+    The assignment follows options.mar01_first/mar02_first. options.mar_mapping, or for "description"
+    the pairs that resolve_march() could decide, override it for the labels they cover. For "description"
+    without descriptions every pair keeps the order and gets a MarchChoice that is not automatic, so that
+    report.needs_review lists it.
+    """
+    corrected = dict(CORRECTED)
+    first_mar01, first_mar02 = options.mar01_first, options.mar02_first
+    second_mar01, second_mar02 = MAR01_GENES[first_mar01], MAR02_GENES[first_mar02]
+    corrected["MAR-01_1st"], corrected['Mar-01_1st'], corrected["01-MAR_1st"], corrected["01-Mar_1st"] = first_mar01, first_mar01, first_mar01, first_mar01
+    corrected["MAR-01_2nd"], corrected["Mar-01_2nd"], corrected["01-MAR_2nd"], corrected["01-Mar_2nd"] = second_mar01, second_mar01, second_mar01, second_mar01
+    corrected["MAR-02_1st"], corrected["Mar-02_1st"], corrected["02-MAR_1st"], corrected["02-Mar_1st"] = first_mar02, first_mar02, first_mar02, first_mar02
+    corrected["MAR-02_2nd"], corrected["Mar-02_2nd"], corrected["02-MAR_2nd"], corrected["02-Mar_2nd"] = second_mar02, second_mar02, second_mar02, second_mar02
+    choices = []
+    if options.mar_resolution == "mapping":
+        for label, gene in options.mar_mapping.items():
+            corrected.update(dict.fromkeys(_variants(label), gene))
+    elif options.mar_resolution == "description" and descriptions is not None:
+        assignments, choices = resolve_march(list(numbered), list(descriptions), reference)
+        corrected.update(assignments)
+    elif options.mar_resolution == "description":
+        choices = [MarchChoice(date, labels, [corrected.get(label) for label in labels], "none", 0.0, 0.0, False)
+                   for date, labels, _ in _march_pairs(numbered)]
+    return corrected, choices
+
+
+def description_column(found):
+    """The gene descriptions of found: the README asks for them in the second column, the first after the names."""
+    return found.iloc[:, 0] if found.shape[1] != 0 else None
+
+
+def _date_changes(report, numbered, new, options):
+    """Count the date rows of numbered by the rule that gave them their new label: text_date (CORRECTED),
+    mar_order, mar_description or mar_mapping (Mar-01/Mar-02), or numbered_only when no gene is known for
+    the date. Rows left without a gene are listed in report.missing."""
+    if report is None:
+        return
+    decided = {label for choice in report.march_choices if choice.automatic for label in choice.labels}
+    mapped = set()
+    if options.mar_resolution == "mapping":
+        mapped = {variant for label in options.mar_mapping for variant in _variants(label)}
+    rules = Counter()
+    for old, gene in zip(numbered, new):
+        if pd.isna(gene):
+            report.missing.append(old)
+        elif MAR01_REGEX.search(old) or MAR02_REGEX.search(old):
+            rules["mar_mapping" if old in mapped else "mar_description" if old in decided else "mar_order"] += 1
+        else:
+            rules["text_date" if gene != old else "numbered_only"] += 1
+    for rule, count in rules.items():
+        _count(report, rule, count)
+
+
+def _merge_back(df, date_search, found):
+    index_name = df.index.name
+    df = df.drop(index=date_search)  # drop the date genes from the main df
+    df2 = pd.concat([df, found], axis=0)  # join these genes back to the main df
+    df2.sort_index(axis=0, ascending=True, inplace=True)  # sort alphabetically
+    df2.index.name = index_name
+    return df2
+
+
+################ Contains dates and March-01/March-02 and have to be resolved ####################
+def march_resolver(df, date_search, options, reference=None, report=None):
+    """Dates including Mar-01/Mar-02. Dates that have no gene (e.g. a third Mar-01) become <NA>."""
+    with _stage(report, "resolve", len(date_search)):
+        found = number_duplicates(df, date_search)
+        corrected, choices = march_corrections(options, found.index, description_column(found), reference)
+        if report is not None:
+            report.march_choices = choices
+    with _stage(report, "rename", len(found)):
+        numbered = found.index
+        found.index = found.index.map(lambda g: corrected.get(g, pd.NA))
+        _date_changes(report, numbered, found.index, options)
+    with _stage(report, "sort", len(df)):
+        return _merge_back(df, date_search, found)
+
+
+############ Contains dates but no march-01/march-02 and thus nothing to resolve ##############
+def date_resolver(df, date_search, options=None, report=None):
+    """Dates without Mar-01/Mar-02. Dates that have no gene keep their numbered label."""
+    with _stage(report, "resolve", len(date_search)):
+        found = number_duplicates(df, date_search)
+    with _stage(report, "rename", len(found)):
+        numbered = found.index
+        found.rename(index=CORRECTED, inplace=True)
+        _date_changes(report, numbered, found.index, options or ConversionOptions())
+    with _stage(report, "sort", len(df)):
+        return _merge_back(df, date_search, found)
+
+
+############################## Dates are only numbers ##########################################
+def numeric_date(df, numdate, options, report=None):
+    """Rename numeric dates to the Mon-DD (or Mon-YY) text form so that the date resolvers can read them."""
+    with _stage(report, "normalize", len(df)):
+        extracted = numeric_mapping(numdate, options, report)
+        _count(report, "numeric_date", df.index.isin(list(extracted)).sum())
+        return df.rename(index=extracted), extracted
+
+
+def _date_numbers(numdate):
+    """The three numbers of every label in numdate and how many digits each has; rows that are not dates are 0."""
+    parts = pd.Series(numdate, dtype=object).str.extract(NUMDATE_PARTS).fillna("")
+    digits = np.stack([parts[i].str.len().to_numpy(dtype=int) for i in range(3)], axis=1)
+    numbers = np.stack([pd.to_numeric(parts[i].where(parts[i] != "", "0")).to_numpy(dtype=int) for i in range(3)], axis=1)
+    return numbers, digits
+
+
+def _valid_dates(numbers, digits, date_format):
+    """(valid, year, month, day) of every row of numbers read in date_format, as strptime would accept them."""
+    y, m, d = DATE_FORMATS[date_format]
+    year, month, day = numbers[:, y], numbers[:, m], numbers[:, d]
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    valid = ((digits[:, y] == 4) & (digits[:, m] <= 2) & (digits[:, d] <= 2) & (month >= 1) & (month <= 12)
+             & (day >= 1) & (day <= MONTH_DAYS[np.clip(month, 0, 12)]) & ((month != 2) | (day <= 28) | leap))
+    return valid, year, month, day
+
+
+def infer_date_format(numdate):
+    """The layout of DATE_FORMATS under which every label in numdate is a date, or None if there is not exactly one."""
+    numbers, digits = _date_numbers(sorted(set(numdate)))
+    fits = [f for f in DATE_FORMATS if len(numbers) and _valid_dates(numbers, digits, f)[0].all()]
+    return fits[0] if len(fits) == 1 else None
+
+
+def numeric_mapping(numdate, options, report=None):
+    """{numeric date: Mon-DD or Mon-YY} for the layout in options.
+
+    Every distinct label is split by one regex pass and checked with array arithmetic, so the cost does not grow
+    with a per-label parser call. With date_format "auto" the layout is inferred and, when more than one layout
+    fits, the default yyyy-dd-mm is used.
+    """
+    unique = sorted(set(numdate))
+    date_format = options.date_format
+    if date_format == AUTO_DATE_FORMAT:
+        date_format = infer_date_format(unique) or ConversionOptions.date_format
+    if report is not None:
+        report.date_format = date_format
+    numbers, digits = _date_numbers(unique)
+    valid, year, month, day = _valid_dates(numbers, digits, date_format)
+    # labels that are not dates in this layout are left for the user to check
+    second = year % 100 if options.date_info == "month-year" else day
+    text = MONTHS[month[valid]] + "-" + pd.Series(second[valid]).map("{:02d}".format).to_numpy(dtype=object)
+    return dict(zip(compress(unique, valid), text))
+
+
+############################ Just old symbols and no date issues ###############################
+def nodates(df, reference, report=None):
+    with _stage(report, "rename", len(df)):
+        renamed = df.copy(deep=False)
+        renamed.index = reference.rename(df.index, case_sensitive=False)
+        _count(report, "previous_symbol", _changed(df.index, renamed.index))
+        return renamed
+
+
+def march_rows(df, options=None, reference=None):
+    """The numbered Mar-01/Mar-02 rows of df, for showing next to the choice of MTARC vs MARCHF.
+
+    The labels are classified and their numeric dates read on the index alone; only the date rows of df are
+    taken out of it.
+    """
+    options = options or ConversionOptions()
+    reference = default_index() if reference is None else reference
+    labels = upper_labels(df.index)
+    if _classify(labels.tolist(), reference) == "numeric":
+        mapping = numeric_mapping(find_numeric_dates(labels), options)
+        labels = pd.Index([mapping.get(g, g) for g in labels], dtype=object)
+    is_date = date_mask(labels)
+    date_search = labels[is_date].tolist()
+    if len(find_march(date_search)) == 0:
+        return df.iloc[:0]
+    rows = df.iloc[np.flatnonzero(is_date)]
+    rows.index = pd.Index(date_search, dtype=object, name=df.index.name)
+    found = number_duplicates(rows, date_search)
+    labels = found.index.tolist()
+    return found.loc[[f for f in labels if MAR01_REGEX.search(f) or MAR02_REGEX.search(f)]]
+
+
+################################################# Code Flow ##########################################################
+
+# since it's quite likely that old symbols don't exist together with dates (because once opened in excel all are dates),
+# this is an all-or-none approach where if date search picks up sth, old search will be empty
+# if both lists are empty, nothing is wrong, and the df is returned as it is
+
+def convert(df, options=None, reference=None, report=None):
+    """Convert misidentified gene names in the index of df.
+
+    reference is a SymbolIndex or SortedSymbolIndex and defaults to date_gene_reference.default_index().
+    report, if given, is filled in instead of a new ConversionReport, so that callers can add their own read
+    and export stages to it or set its profiling hook. Returns (cleaned, report). df itself is never modified.
+    """
+    options = options or ConversionOptions()
+    reference = default_index() if reference is None else reference
+    report = ConversionReport() if report is None else report
+    report.rows_in = len(df)
+    if options.row_order == "original":
+        cleaned, _ = relabel_frame(df, options, reference, report=report)
+    else:
+        cleaned = _convert(df, options, reference, report)
+    cleaned = collapse_duplicates(cleaned, options.duplicates, report)
+    report.rows_out = len(cleaned)
+    return cleaned, report
+
+
+def _convert(df, options, reference, report):
+    with report.stage("normalize", len(df)):
+        df = prepare_index(df)
+        labels = df.index.tolist()
+
+    with report.stage("detect", len(labels)):
+        date_search = find_dates(labels)
+        march = len(date_search) != 0 and len(find_march(date_search)) != 0
+    if len(date_search) != 0:
+        report.misidentified = date_search
+        if march:
+            report.status = "march"
+            return march_resolver(df, date_search, options, reference, report)
+        report.status = "dates"
+        return date_resolver(df, date_search, options, report)
+
+    with report.stage("detect", len(labels)):
+        old_search = find_old_symbols(labels, reference)
+        report.ambiguous = find_ambiguous(labels, reference)
+    if len(old_search) != 0:
+        report.status, report.misidentified = "old_symbols", old_search
+        return nodates(df, reference, report)  # converts old to new (eg. DEC1 -> DELEC1)
+
+    with report.stage("detect", len(labels)):
+        numdate = find_numeric_dates(labels)
+    if len(numdate) != 0:
+        report.status, report.misidentified = "numeric", numdate
+        renamed, report.numeric_dates = numeric_date(df, numdate, options, report)
+        with report.stage("detect", len(renamed)):
+            generic_date = find_dates(renamed.index.tolist())
+            march = len(generic_date) != 0 and len(find_march(generic_date)) != 0
+        if len(generic_date) == 0:
+            return renamed
+        if march:
+            return march_resolver(renamed, generic_date, options, reference, report)
+        return date_resolver(renamed, generic_date, options, report)
+
+    return df
+
+
+############################################# Label-only path ########################################################
+def _resolved_dates(date_search, options, march, descriptions, reference, report):
+    with report.stage("resolve", len(date_search)):
+        formatted = format_dates(date_search)
+        numbered = _numbered([formatted.get(d, d) for d in date_search])
+        if march:
+            corrected, report.march_choices = march_corrections(options, numbered, descriptions, reference)
+            new = [corrected.get(g, pd.NA) for g in numbered]
+        else:
+            new = [CORRECTED.get(g, g) for g in numbered]
+        _date_changes(report, numbered, new, options)
+    return new
+
+
+def relabel(labels, options=None, reference=None, descriptions=None, report=None):
+    """New gene label for every entry of labels, following the same rules as convert().
+
+    Only the labels are needed, so this is what streamed and in-place conversions use. Unlike convert(), rows
+    are neither de-duplicated nor sorted: the result lines up with labels. descriptions, lined up with labels,
+    is only read for options.mar_resolution="description". report is as for convert(). Returns (new labels, report).
+    """
+    options = options or ConversionOptions()
+    reference = default_index() if reference is None else reference
+    report = ConversionReport() if report is None else report
+    report.rows_in = report.rows_out = len(labels)
+    with report.stage("normalize", len(labels)):
+        labels = pd.Index(labels).astype(str).str.upper()
+        new = labels.to_numpy(dtype=object).copy()
+        descriptions = None if descriptions is None else np.asarray(descriptions, dtype=object)
+
+    with report.stage("detect", len(new)):
+        is_date = date_mask(new)
+    if is_date.any():
+        report.misidentified = new[is_date].tolist()
+        report.status = "march" if len(find_march(report.misidentified)) != 0 else "dates"
+        new[is_date] = _resolved_dates(report.misidentified, options, report.status == "march",
+                                       None if descriptions is None else descriptions[is_date], reference, report)
+        return new, report
+
+    with report.stage("detect", len(new)):
+        old_search = find_old_symbols(labels, reference)
+        report.ambiguous = find_ambiguous(labels, reference)
+    if len(old_search) != 0:
+        report.status, report.misidentified = "old_symbols", old_search
+        with report.stage("rename", len(new)):
+            renamed = reference.rename(labels, case_sensitive=False).to_numpy(dtype=object)
+            _count(report, "previous_symbol", _changed(new, renamed))
+        return renamed, report
+
+    with report.stage("detect", len(new)):
+        numdate = find_numeric_dates(new)
+    if len(numdate) != 0:
+        report.status, report.misidentified = "numeric", numdate
+        with report.stage("normalize", len(new)):
+            report.numeric_dates = numeric_mapping(numdate, options, report)
+            _count(report, "numeric_date", np.isin(new, list(report.numeric_dates)).sum())
+            new = np.array([report.numeric_dates.get(g, g) for g in new], dtype=object)
+        with report.stage("detect", len(new)):
+            is_date = date_mask(new)
+        if is_date.any():
+            date_search = new[is_date].tolist()
+            new[is_date] = _resolved_dates(date_search, options, len(find_march(date_search)) != 0,
+                                           None if descriptions is None else descriptions[is_date], reference, report)
+    return new, report
+
+
+def relabel_batch(label_lists, options=None, reference=None):
+    """[relabel(labels, options, reference) for labels in label_lists], with the detection and old symbol
+    lookups done once over all lists.
+
+    Each list is still converted on its own terms (its own status, numbering and report), so the results are
+    those of separate relabel() calls; only lists holding dates go through relabel() one by one. This is what
+    makes many small requests, e.g. to the HTTP service, cost about as much as one large one.
+    """
+    options = options or ConversionOptions()
+    reference = default_index() if reference is None else reference
+    sizes = [len(labels) for labels in label_lists]
+    ends = np.cumsum(sizes)
+    flat = [label for labels in label_lists for label in labels]
+    upper = pd.Index(flat, dtype=object).astype(str).str.upper()
+    new = upper.to_numpy(dtype=object)
+    is_date = date_mask(new)
+    is_old = reference.contains(upper, case_sensitive=False)
+    is_numeric = _match_mask(new, NUMDATE_REGEX)
+    renamed = reference.rename(upper, case_sensitive=False).to_numpy(dtype=object) if is_old.any() else new
+    ambiguous = find_ambiguous(upper, reference)
+
+    results = []
+    for labels, end, size in zip(label_lists, ends, sizes):
+        part = slice(end - size, end)
+        if is_date[part].any() or (is_numeric[part].any() and not is_old[part].any()):
+            results.append(relabel(labels, options, reference))
+            continue
+        report = ConversionReport(rows_in=size, rows_out=size)
+        if ambiguous:
+            report.ambiguous = {label: ambiguous[label] for label in new[part] if label in ambiguous}
+        if is_old[part].any():
+            report.status, report.misidentified = "old_symbols", sorted(set(new[part][is_old[part]]))
+            _count(report, "previous_symbol", _changed(new[part], renamed[part]))
+            results.append((renamed[part].copy(), report))
+        else:
+            results.append((new[part].copy(), report))
+    return results
+
+
+def relabel_frame(df, options=None, reference=None, inplace=False, report=None):
+    """df with its index replaced by relabel() of it, keeping the rows in their original order.
+
+    Only a new index is built and swapped on: no data column is copied, split, joined back or sorted, so the
+    cost does not grow with the width of the matrix. The result is a shallow copy sharing df's data, or df
+    itself with inplace=True. Unlike convert()'s default, identical repeated date rows are numbered rather
+    than dropped, and unresolved labels stay where they were. Returns (frame, report).
+    """
+    options = options or ConversionOptions()
+    descriptions = description_column(df) if options.mar_resolution == "description" else None
+    new, report = relabel(df.index, options, reference, descriptions, report)
+    with report.stage("rename", len(new)):
+        frame = df if inplace else df.copy(deep=False)
+        frame.index = pd.Index(new, dtype=object, name=df.index.name)
+    return frame, report
+
+
+############################################# Duplicate genes ########################################################
+def collapse_duplicates(df, how="keep", report=None):
+    """Rows of df that share a gene merged by how, one of DUPLICATE_STRATEGIES.
+
+    "keep" leaves them all, "first"/"last" keep one row, and "sum", "mean", "max" and "min" aggregate the
+    numeric columns into the first row of each gene (other columns keep its values). Rows without a gene
+    (<NA>) are never merged with each other, and every row keeps its place.
+    """
+    if how not in DUPLICATE_STRATEGIES:
+        raise ValueError(f"duplicates must be one of {DUPLICATE_STRATEGIES}")
+    if how == "keep":
+        return df
+    with _stage(report, "dedupe", len(df)):
+        named = ~pd.isna(df.index)
+        repeated = df.index.duplicated(keep=False) & named
+        if not repeated.any():
+            return df
+        if how in ("first", "last"):
+            cleaned = df[~(df.index.duplicated(keep=how) & named)]
+        else:
+            first = repeated & ~df.index.duplicated(keep="first")
+            keep = ~repeated | first
+            cleaned = df[keep].copy()
+            numeric = [i for i, dtype in enumerate(df.dtypes) if pd.api.types.is_numeric_dtype(dtype)
+                       and not pd.api.types.is_bool_dtype(dtype)]
+            merged = df.iloc[repeated, numeric].groupby(level=0, sort=False).agg(how)  # in order of first appearance
+            rows = np.cumsum(keep)[first] - 1  # where the first row of each repeated gene ended up in cleaned
+            for j, column in enumerate(numeric):
+                if merged.dtypes.iloc[j] != cleaned.dtypes.iloc[column]:
+                    cleaned[cleaned.columns[column]] = cleaned.iloc[:, column].astype(merged.dtypes.iloc[j])
+                cleaned.iloc[rows, column] = merged.iloc[:, j].to_numpy()
+        _count(report, f"duplicates_{how}", len(df) - len(cleaned))
+    return cleaned
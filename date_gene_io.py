@@ -0,0 +1,534 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+File input/output for the Gene Updater tool.
+
+convert_csv_chunked() converts CSV files that do not fit in memory: a first pass reads only the gene
+column and works out every new label with engine.relabel(), and a second pass streams the file in chunks of
+raw records, swaps the first field of each record and appends the chunk straight to the output. The other
+fields are copied as they are, without being parsed.
+
+detect_format() tells the format of a file from its first bytes (Parquet, Feather, xlsx, gzip, zstd, bz2 and
+xz all start with a signature) and from its full extension, so counts.tsv.zst and data.v2.csv are both read as
+what they are; a .txt file is comma or tab separated as its first line says, and anything else (an .xls
+workbook, a PDF) gets None. read_table() and write_table() read and write CSV/TSV (plain or compressed),
+Parquet, Feather and xlsx; with gene_column_only, Parquet and Feather read nothing but the gene column, and
+CSV/TSV only parse it.
+convert_columnar_chunked() is the Parquet/Feather counterpart of convert_csv_chunked(), one record batch at a time.
+
+Excel workbooks are opened lazily: excel_sheet_names() lists the sheets without parsing them, and
+read_excel_sheet() parses one sheet, with calamine when python-calamine is installed; the web tool parses only
+the sheets that are selected.
+
+write_zip() packs cleaned dataframes into one ZIP archive, streaming each CSV member straight into the
+archive instead of rendering it as a string first.
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import os
+import zipfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import PurePath
+from typing import Optional
+
+import pandas as pd
+
+import date_gene_engine as engine
+
+
+CHUNKSIZE = 100_000
+EXTENSIONS = {".csv": "csv", ".tsv": "tsv", ".txt": "tsv", ".tab": "tsv", ".parquet": "parquet", ".pq": "parquet",
+              ".feather": "feather", ".arrow": "feather", ".xlsx": "xlsx", ".xlsm": "xlsx"}
+COMPRESSIONS = {".gz": "gzip", ".zst": "zstd", ".zstd": "zstd", ".bz2": "bz2", ".xz": "xz"}
+SNIFFED_EXTENSIONS = (".txt",)  # text of either separator, told apart by its first line
+# first bytes of each format; a ZIP archive that is not named .csv/.tsv is taken as an xlsx workbook
+MAGIC = [(b"PAR1", "parquet"), (b"ARROW1", "feather"), (b"FEA1", "feather"), (b"PK\x03\x04", "xlsx")]
+COMPRESSION_MAGIC = [(b"\x1f\x8b", "gzip"), (b"\x28\xb5\x2f\xfd", "zstd"), (b"BZh", "bz2"), (b"\xfd7zXZ\x00", "xz")]
+TEXT_FORMATS = ("csv", "tsv")
+COLUMNAR_FORMATS = ("parquet", "feather")
+EXPORT_FORMATS = ("csv", "tsv", "csv.gz", "tsv.gz", "csv.zst", "tsv.zst", "parquet", "feather", "xlsx")
+EXCEL_ENGINES = ("calamine", "openpyxl")
+
+
+@dataclass(frozen=True)
+class FileFormat:
+    kind: str  # one of "csv", "tsv", "parquet", "feather", "xlsx"
+    compression: Optional[str] = None  # "gzip", "zstd", "bz2" or "xz", for csv and tsv only
+
+    @property
+    def sep(self):
+        return "\t" if self.kind == "tsv" else ","
+
+    @property
+    def extension(self):
+        suffix = {"gzip": ".gz", "zstd": ".zst", "bz2": ".bz2", "xz": ".xz"}.get(self.compression, "")
+        return "." + self.kind + suffix
+
+
+def _extension(name):
+    """(extension, compression) of name: counts.tsv.zst -> (".tsv", "zstd"), genes -> (None, None)."""
+    suffixes = [s.lower() for s in PurePath(str(name)).suffixes][-2:]
+    compression = COMPRESSIONS.get(suffixes[-1]) if suffixes else None
+    if compression:
+        suffixes.pop()
+    return (suffixes[-1] if suffixes else None), compression
+
+
+def format_from_name(name):
+    """FileFormat given by the full extension of name (counts.tsv.zst, data.v2.csv), or None for an unknown one.
+    A .txt file is taken as TSV here; detect_format() reads its first line to tell."""
+    extension, compression = _extension(name)
+    kind = EXTENSIONS.get(extension)
+    if kind is None or (compression and kind not in TEXT_FORMATS):
+        return None
+    return FileFormat(kind, compression)
+
+
+def stem(name):
+    """File name without the extension of its format: sample.counts.csv.gz -> sample.counts."""
+    name = os.path.basename(str(name))
+    found = format_from_name(name)
+    if found is not None:
+        suffixes = PurePath(name).suffixes
+        return name[:-sum(len(x) for x in suffixes[-(2 if found.compression else 1):])]
+    return name.partition(".")[0]
+
+
+def _name(src):
+    if isinstance(src, (str, os.PathLike)):
+        return os.fspath(src)
+    return getattr(src, "name", None) or ""
+
+
+def _peek(src, size=8):
+    """The first size bytes of src, a path or a seekable binary file object, without moving its position."""
+    if isinstance(src, (str, os.PathLike)):
+        with open(src, "rb") as fp:
+            return fp.read(size)
+    if isinstance(src, io.TextIOBase) or not hasattr(src, "seek"):
+        return b""
+    at = src.tell()
+    head = src.read(size)
+    src.seek(at)
+    return head if isinstance(head, bytes) else b""
+
+
+def sniffs_separator(name):
+    """True when the extension of name (.txt) does not tell whether the text is comma or tab separated."""
+    return _extension(name)[0] in SNIFFED_EXTENSIONS
+
+
+def detect_format(src, name=None):
+    """FileFormat of src, a path or a seekable binary file object such as an upload; name is its file name when
+    src is a file object. The first bytes decide Parquet, Feather, xlsx and the compression; the extension, or
+    the first line for .txt and for compressed files without a text extension, whether the text inside is comma
+    or tab separated. Returns None when neither the first bytes nor the extension name a supported format, or
+    when text turns out not to be text."""
+    head = _peek(src)
+    name = name or _name(src)
+    by_name = format_from_name(name)
+    is_text = by_name is not None and by_name.kind in TEXT_FORMATS
+    for magic, kind in MAGIC:
+        if head.startswith(magic) and not (kind == "xlsx" and is_text):
+            return FileFormat(kind)
+    compression = _compression(head)
+    if not head and by_name is not None:  # nothing to look at, e.g. a text stream
+        return by_name
+    if is_text and not sniffs_separator(name):
+        return FileFormat(by_name.kind, compression)
+    if not is_text and compression is None:
+        return None
+    kind = _sniff_separator(src, compression)
+    return None if kind is None else FileFormat(kind, compression)
+
+
+def _compression(head):
+    return next((c for magic, c in COMPRESSION_MAGIC if head.startswith(magic)), None)
+
+
+def _sniff_separator(src, compression):
+    """"csv" or "tsv" from the first line of src, or None when its first bytes are not UTF-8 text."""
+    with _binary(src, compression) as raw:
+        sample = raw.read(1 << 16)
+    _rewind(src)
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as error:
+        if error.start < len(sample) - 3:  # not just a character cut off at the end of the sample
+            return None
+    if b"\0" in sample:
+        return None
+    line = sample.split(b"\n", 1)[0]
+    return "tsv" if line.count(b"\t") > line.count(b",") else "csv"
+
+
+def _has_zstandard():
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@contextmanager
+def _binary(handle, compression=None, mode="rb"):
+    """handle (a path or binary file object) opened for reading or writing bytes through compression. A file
+    object stays open for the caller. zstd goes through zstandard when it is installed, else through pyarrow."""
+    is_path = isinstance(handle, (str, os.PathLike))
+    if compression is None:
+        if is_path:
+            with open(handle, mode) as fp:
+                yield fp
+        else:
+            yield handle
+        return
+    if compression == "zstd" and not _has_zstandard():
+        import pyarrow as pa
+        if is_path:
+            stream = (pa.CompressedInputStream if "r" in mode else pa.CompressedOutputStream)(os.fspath(handle), "zstd")
+            with stream:
+                yield stream
+        elif "r" in mode:  # pyarrow closes what it wraps, so it gets the bytes, not the caller's file
+            with pa.CompressedInputStream(pa.BufferReader(handle.read()), "zstd") as stream:
+                yield stream
+        else:
+            buffer = pa.BufferOutputStream()
+            with pa.CompressedOutputStream(buffer, "zstd") as stream:
+                yield stream
+            handle.write(buffer.getvalue().to_pybytes())
+        return
+    if compression == "zstd":
+        import zstandard
+        opened = zstandard.open(handle, mode, closefd=is_path)
+    elif compression == "gzip":
+        opened = gzip.GzipFile(filename=handle, mode=mode) if is_path else gzip.GzipFile(fileobj=handle, mode=mode)
+    else:
+        opened = {"bz2": bz2.BZ2File, "xz": lzma.LZMAFile}[compression](handle, mode)
+    with opened:
+        yield opened
+
+
+def _rewind(handle):
+    if hasattr(handle, "seek"):
+        handle.seek(0)
+
+
+@contextmanager
+def _open_text(handle, mode):
+    if isinstance(handle, str):
+        with open(handle, mode, encoding="utf-8", newline="") as fp:
+            yield fp
+    elif isinstance(handle, io.TextIOBase):
+        yield handle
+    else:  # a binary file object, e.g. an uploaded BytesIO, which stays open for the caller
+        wrapper = io.TextIOWrapper(handle, encoding="utf-8", newline="")
+        try:
+            yield wrapper
+        finally:
+            wrapper.flush()
+            wrapper.detach()
+
+
+def read_gene_columns(src, sep=",", chunksize=CHUNKSIZE, columns=1, compression=None):
+    """The first columns of the CSV at src as text, or as many as it has. No other column is kept, however long
+    the rows are."""
+    _rewind(src)
+    with _binary(src, compression) as raw:
+        columns = min(columns, pd.read_csv(raw, sep=sep, nrows=0).shape[1])  # the header alone
+    _rewind(src)
+    with _binary(src, compression) as raw:
+        reader = pd.read_csv(raw, sep=sep, usecols=range(columns), dtype=str, keep_default_na=False,
+                             chunksize=chunksize)
+        return pd.concat([chunk.iloc[:, :columns] for chunk in reader], ignore_index=True)
+
+
+def _open_quote(line, sep, quoted=False):
+    """Whether a quoted field is still open at the end of line; quoted tells whether one was open at its start.
+    As in pandas, a quote only opens a field at the start of the field: in an unquoted field (5" screw) it is
+    an ordinary character, and inside a quoted field "" is an escaped quote."""
+    at = 0
+    while True:
+        if quoted:
+            end = line.find('"', at)
+            if end < 0:
+                return True
+            if line.startswith('"', end + 1):  # "" inside quotes
+                at = end + 2
+                continue
+            quoted, at = False, end + 1
+        elif line.startswith('"', at):
+            quoted, at = True, at + 1
+            continue
+        cut = line.find(sep, at)
+        if cut < 0:
+            return False
+        at = cut + 1
+
+
+def _records(lines, sep=","):
+    """Raw CSV records, joining the lines of a quoted field that holds a newline. Blank lines are skipped,
+    as pandas skips them too."""
+    pending, quoted = "", False
+    for line in lines:
+        pending += line
+        quoted = _open_quote(line, sep, quoted) if quoted or '"' in line else False
+        if not quoted:
+            if pending.strip("\r\n"):
+                yield pending
+            pending = ""
+    if pending.strip("\r\n"):
+        yield pending
+
+
+def _rest(record, sep):
+    """Everything after the first field of record, starting with the separator or the line ending."""
+    if record.startswith('"'):
+        end = 1
+        while True:
+            end = record.index('"', end)
+            if record[end + 1:end + 2] != '"':
+                return record[end + 1:]
+            end += 2
+    cut = record.find(sep)
+    if cut < 0:
+        cut = len(record.rstrip("\r\n"))
+    return record[cut:]
+
+
+def _field(label, sep):
+    if label is pd.NA or label is None:
+        return ""
+    if sep in label or '"' in label or "\n" in label or "\r" in label:
+        return '"' + label.replace('"', '""') + '"'
+    return label
+
+
+def convert_csv_chunked(src, dst, options=None, reference=None, chunksize=CHUNKSIZE, sep=",", report=None):
+    """Convert the gene column of the CSV at src into dst, holding at most chunksize records in memory.
+
+    src is a path or a seekable file object, as it is read twice; dst is a path or a writable text file. A
+    compressed src is decompressed on the fly, and dst is compressed as its extension says (.gz, .zst, ...).
+    The gene labels are numbered (Mar-01_1st, Mar-01_2nd, ...) over the whole file before any chunk is
+    written, so the Mar-01/Mar-02 assignment does not depend on where chunks start. Rows keep their order
+    and the other columns are copied byte for byte. Returns the ConversionReport, or fills in report if given.
+    """
+    report = engine.ConversionReport() if report is None else report
+    with_descriptions = options is not None and options.mar_resolution == "description"
+    compression = _compression(_peek(src))
+    out_format = format_from_name(dst) if isinstance(dst, (str, os.PathLike)) else None
+    with report.stage("read"):
+        first = read_gene_columns(src, sep=sep, chunksize=chunksize, columns=2 if with_descriptions else 1,
+                                  compression=compression)
+    descriptions = first.iloc[:, 1] if first.shape[1] > 1 else None
+    new, report = engine.relabel(first.iloc[:, 0], options, reference, descriptions, report)
+
+    _rewind(src)
+    with report.stage("export", len(new)), _binary(src, compression) as raw_in, _open_text(raw_in, "r") as reader, \
+            _binary(dst, out_format and out_format.compression, "wb") as raw_out, _open_text(raw_out, "w") as out:
+        records = _records(reader, sep)
+        out.write(next(records, ""))  # header
+        chunk, row = [], 0
+        for record in records:
+            if row >= len(new):
+                raise ValueError("the CSV has more records than gene labels; check its quoting")
+            chunk.append(_field(new[row], sep) + _rest(record, sep))
+            row += 1
+            if len(chunk) == chunksize:
+                out.write("".join(chunk))
+                chunk = []
+        out.write("".join(chunk))
+    if row != len(new):
+        raise ValueError("the CSV has fewer records than gene labels; check its quoting")
+    return report
+
+
+############################################### Tables by format #####################################################
+def _gene_columns(schema, columns=1):
+    """Names of the gene column and the columns after it in an Arrow schema: the index pandas stored, if any,
+    comes first, as read_csv(index_col=0) would have it."""
+    index = [c for c in (schema.pandas_metadata or {}).get("index_columns", []) if isinstance(c, str)]
+    return (index[:1] + [n for n in schema.names if n not in index])[:columns]
+
+
+def _arrow_file(src, kind):
+    """A pyarrow reader of the Parquet or Feather file src, and its schema. The reader is None for Feather
+    version 1 files, which have no record batches."""
+    import pyarrow as pa
+    _rewind(src)
+    if kind == "parquet":
+        import pyarrow.parquet as pq
+        reader = pq.ParquetFile(src)
+        return reader, reader.schema_arrow
+    source = pa.memory_map(os.fspath(src)) if isinstance(src, (str, os.PathLike)) else src
+    try:
+        reader = pa.ipc.open_file(source)
+    except pa.ArrowInvalid:
+        import pyarrow.feather as feather
+        _rewind(src)
+        return None, feather.read_table(source).schema
+    return reader, reader.schema
+
+
+def read_columnar_genes(src, kind, columns=1):
+    """The gene column (and the columns after it, up to columns) of the Parquet or Feather file src as text.
+    Only these columns are read from the file."""
+    import pyarrow.feather as feather
+    reader, schema = _arrow_file(src, kind)
+    names = _gene_columns(schema, columns)
+    if kind == "parquet":
+        table = reader.read(columns=names, use_pandas_metadata=False)
+    else:
+        _rewind(src)
+        table = feather.read_table(src, columns=names, memory_map=isinstance(src, (str, os.PathLike)))
+    genes = table.replace_schema_metadata(None).to_pandas()  # the stored index comes back as a plain column
+    return genes.astype(str).where(genes.notna(), "")
+
+
+def read_table(src, fmt=None, sheet=0, gene_column_only=False):
+    """The table at src (a path or a binary file object) with the gene names as index, in the FileFormat fmt or
+    the one detect_format() finds; sheet picks the sheet of a workbook. With gene_column_only, no other column is
+    kept, e.g. for engine.relabel() on a file that is converted elsewhere; Parquet and Feather then read no
+    other column from the file. Raises ValueError for a file of no supported format."""
+    fmt = fmt or detect_format(src)
+    if fmt is None:
+        raise ValueError(f"{_name(src) or 'the file'} is not a CSV/TSV, Parquet, Feather or xlsx file")
+    _rewind(src)
+    if fmt.kind == "xlsx":
+        return read_excel_sheet(src, sheet, gene_column_only=gene_column_only)
+    if gene_column_only:
+        if fmt.kind in COLUMNAR_FORMATS:
+            genes = read_columnar_genes(src, fmt.kind).iloc[:, 0]
+        else:
+            genes = read_gene_columns(src, sep=fmt.sep, compression=fmt.compression).iloc[:, 0]
+        return pd.DataFrame(index=pd.Index(genes, name=genes.name))
+    if fmt.kind == "parquet":
+        df = pd.read_parquet(src)
+    elif fmt.kind == "feather":
+        df = pd.read_feather(src)
+    else:
+        with _binary(src, fmt.compression) as raw:
+            return pd.read_csv(raw, sep=fmt.sep, index_col=0)
+    # Feather files, and Parquet files written without their index, hold the genes in their first column
+    return df.set_index(df.columns[0]) if isinstance(df.index, pd.RangeIndex) and df.index.name is None else df
+
+
+def write_table(df, dst, fmt):
+    """Write df, with its gene index, to dst (a path or a writable binary file object) in the FileFormat fmt."""
+    if fmt.kind == "parquet":
+        df.to_parquet(dst)
+    elif fmt.kind == "feather":
+        df.reset_index().to_feather(dst)  # Feather keeps no index, so the genes go first as a column
+    elif fmt.kind == "xlsx":
+        df.to_excel(dst)
+    else:
+        with _binary(dst, fmt.compression, "wb") as raw, _open_text(raw, "w") as text:
+            df.to_csv(text, sep=fmt.sep)
+    return dst
+
+
+def convert_columnar_chunked(src, dst, kind, options=None, reference=None, chunksize=CHUNKSIZE, report=None):
+    """Convert the gene column of the Parquet or Feather file src into dst, in the same format, holding one
+    record batch (of at most chunksize rows for Parquet) in memory.
+
+    As in convert_csv_chunked(), the labels are worked out over the whole gene column before any batch is
+    written, rows keep their order, and the other columns are copied as they are, without going through pandas.
+    Returns the ConversionReport, or fills in report if given.
+    """
+    import pyarrow as pa
+    report = engine.ConversionReport() if report is None else report
+    with_descriptions = options is not None and options.mar_resolution == "description"
+    with report.stage("read"):
+        first = read_columnar_genes(src, kind, columns=2 if with_descriptions else 1)
+    descriptions = first.iloc[:, 1] if first.shape[1] > 1 else None
+    new, report = engine.relabel(first.iloc[:, 0], options, reference, descriptions, report)
+    labels = pa.array([None if pd.isna(label) else label for label in new], type=pa.string())
+
+    with report.stage("export", len(new)):
+        reader, schema = _arrow_file(src, kind)
+        if reader is None:
+            raise ValueError("Feather version 1 files cannot be read in batches; convert them with read_table()")
+        at = schema.get_field_index(first.columns[0])
+        schema = schema.set(at, pa.field(first.columns[0], pa.string()))
+        if kind == "parquet":
+            import pyarrow.parquet as pq
+            codec = reader.metadata.row_group(0).column(0).compression if reader.metadata.num_row_groups else "NONE"
+            writer = pq.ParquetWriter(dst, schema, compression="none" if codec == "UNCOMPRESSED" else codec.lower())
+            batches = reader.iter_batches(batch_size=chunksize, use_pandas_metadata=False)
+        else:
+            codec = "lz4" if pa.Codec.is_available("lz4") else None  # what to_feather compresses with by default
+            writer = pa.ipc.new_file(dst, schema, options=pa.ipc.IpcWriteOptions(compression=codec))
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        row = 0
+        with writer:
+            for batch in batches:
+                arrays = batch.columns
+                arrays[at] = labels.slice(row, batch.num_rows)
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                row += batch.num_rows
+    if row != len(new):
+        raise ValueError("the file has a different number of rows than gene labels")
+    return report
+
+
+################################################ Excel input #########################################################
+@lru_cache(maxsize=None)
+def excel_engine():
+    """calamine (Rust, several times faster than openpyxl) when python-calamine and pandas >= 2.2 are installed,
+    otherwise openpyxl."""
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return "openpyxl"
+    major, minor = (int(x) for x in pd.__version__.split(".")[:2])
+    return "calamine" if (major, minor) >= (2, 2) else "openpyxl"
+
+
+def excel_sheet_names(src, engine=None):
+    """Sheet names of the workbook at src. Only the workbook index is read, not the sheets themselves."""
+    _rewind(src)
+    with pd.ExcelFile(src, engine=engine or excel_engine()) as book:
+        return list(book.sheet_names)
+
+
+def read_excel_sheet(src, sheet, engine=None, gene_column_only=False):
+    """One sheet of the workbook at src with the gene names as index. With gene_column_only, no other column is
+    kept."""
+    _rewind(src)
+    return pd.read_excel(src, sheet_name=sheet, index_col=0, usecols=[0] if gene_column_only else None,
+                         engine=engine or excel_engine())
+
+
+############################################### ZIP export ###########################################################
+def _binary_member(df, fmt):
+    return write_table(df, io.BytesIO(), fmt).getvalue()
+
+
+def write_zip(frames, dst, formats=("csv",), compresslevel=6):
+    """Write every dataframe of frames ({name: cleaned dataframe}) into the ZIP archive dst as cleaned_<name>.<format>.
+
+    dst is a path or a writable binary file object such as a BytesIO. CSV and TSV members are written through
+    the archive as pandas formats them, so no file is ever held as one string; compresslevel (0-9) sets their
+    deflate level. Compressed CSV/TSV (csv.gz, tsv.zst, ...), Parquet, Feather and xlsx members, which are
+    compressed already, are stored as they are; Parquet and Feather need pyarrow, xlsx an Excel writer.
+    """
+    unknown = set(formats) - set(EXPORT_FORMATS)
+    if unknown:
+        raise ValueError(f"unknown export formats: {sorted(unknown)}")
+    with zipfile.ZipFile(dst, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as archive:
+        for name, df in frames.items():
+            for fmt in formats:
+                member = f"cleaned_{name}.{fmt}"
+                found = format_from_name(member)
+                if found.kind in TEXT_FORMATS and found.compression is None:
+                    with archive.open(member, "w", force_zip64=True) as raw, _open_text(raw, "w") as text:
+                        df.to_csv(text, sep=found.sep)
+                else:
+                    archive.writestr(zipfile.ZipInfo(member), _binary_member(df, found),
+                                     compress_type=zipfile.ZIP_STORED)
+    return dst
@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+HGNC reference tables for the Gene Updater tool.
+
+load_reference() parses the hand-curated previous-symbol table and symbol_index() wraps it in a SymbolIndex,
+the prebuilt previous -> approved lookup that the engine uses. hgnc_index() does the same for the complete
+HGNC set (hgnc_complete_set.txt): the TSV is parsed once into a directory of sorted .npy arrays, and later
+startups memory-map those arrays instead of reparsing. The directory is built aside and swapped in whole, one
+process at a time, so workers that start together never see a half-written cache. Every index is built once
+per process and shared by every file, session and thread that asks for the same path.
+
+A previous or alias symbol that names more than one approved gene is never renamed, as any one of them would
+be a guess; find_ambiguous() lists such symbols with their genes.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from functools import cached_property, lru_cache
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REFERENCE_PATH = os.path.join(HERE, "hgnc-symbol-check2.csv")
+HGNC_ENV = "GENE_UPDATER_HGNC"  # path to hgnc_complete_set.txt; when set, it replaces the curated table
+HGNC_CACHE_VERSION = 2
+TABLE_COLUMNS = ["Previous Symbol", "Approved symbol", "Approved name", "HGNC ID", "Location"]
+
+
+@lru_cache(maxsize=None)
+def load_reference(path=REFERENCE_PATH):
+    """Previous Symbol -> Approved symbol table, parsed once per process. Treat the result as read-only."""
+    for_ref = pd.read_csv(path)
+    for_ref.reset_index(drop=True, inplace=True)
+    for_ref.columns = for_ref.iloc[0,:]
+    for_ref.drop(index=0, inplace=True)
+    for_ref.drop(columns="Match type", inplace=True)
+    for_ref.rename(columns={"Input":"Previous Symbol"}, inplace=True)
+    for_ref.columns.name = None
+    return for_ref
+
+
+def _split_ambiguous(table, upper):
+    """(key -> approved symbol for the keys that name one gene, key -> "|"-joined approved symbols for those
+    that name several), both as Series sorted by key. Keys are the previous symbols, upper-cased if upper."""
+    pairs = table[["Previous Symbol", "Approved symbol"]].dropna().astype(str)
+    key = pairs["Previous Symbol"].str.upper() if upper else pairs["Previous Symbol"]
+    pairs = pairs.assign(key=key).drop_duplicates(["key", "Approved symbol"]).sort_values("key", kind="stable")
+    several = pairs["key"].duplicated(keep=False)
+    unique = pd.Series(pairs.loc[~several, "Approved symbol"].to_numpy(dtype=object),
+                       index=pd.Index(pairs.loc[~several, "key"].to_numpy(dtype=object)))
+    ambiguous = pairs[several].groupby("key", sort=True)["Approved symbol"].agg(lambda genes: "|".join(sorted(genes)))
+    return unique, pd.Series(ambiguous.to_numpy(dtype=object), index=pd.Index(ambiguous.index, dtype=object))
+
+
+class SymbolIndex:
+    """Prebuilt previous -> approved symbol lookups for one reference table.
+
+    exact and casefold are read-only dicts (the latter keyed by upper-case symbol). The same pairs are also
+    kept as a Series whose index hash table pandas builds once, so renaming a whole index is a single
+    Index.map call however many files go through it. Previous symbols of more than one approved gene are left
+    out of the lookups and kept apart, see find_ambiguous().
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self._lookup, self._ambiguous = _split_ambiguous(table, upper=False)
+        self._lookup_upper, self._ambiguous_upper = _split_ambiguous(table, upper=True)
+        self.exact = MappingProxyType(self._lookup.to_dict())
+        self.casefold = MappingProxyType(self._lookup_upper.to_dict())
+
+    def __len__(self):
+        return len(self._lookup)
+
+    @cached_property
+    def version(self):
+        """Content hash of the table, so results converted with other tables can be told apart."""
+        return hashlib.sha256(pd.util.hash_pandas_object(self.table, index=False).to_numpy().tobytes()).hexdigest()[:16]
+
+    def _series(self, case_sensitive):
+        return self._lookup if case_sensitive else self._lookup_upper
+
+    def _keys(self, labels, case_sensitive):
+        labels = pd.Index(labels, dtype=object)
+        return labels if case_sensitive else labels.str.upper()
+
+    def contains(self, labels, case_sensitive=True):
+        """Boolean array, True where the label is a previous symbol."""
+        labels = pd.Index(labels, dtype=object)
+        return self._series(case_sensitive).index.get_indexer(self._keys(labels, case_sensitive)) >= 0
+
+    def find(self, labels, case_sensitive=True):
+        """Sorted previous symbols present in labels."""
+        labels = pd.Index(labels, dtype=object)
+        return sorted(set(labels[self.contains(labels, case_sensitive)]))
+
+    def find_ambiguous(self, labels, case_sensitive=True):
+        """{label: approved symbols} for the labels that are previous symbols of more than one gene."""
+        ambiguous = self._ambiguous if case_sensitive else self._ambiguous_upper
+        if len(ambiguous) == 0:
+            return {}
+        labels = pd.Index(labels, dtype=object)
+        genes = self._keys(labels, case_sensitive).map(ambiguous)
+        hits = pd.notna(genes)
+        return {label: found.split("|") for label, found in zip(labels[hits], genes[hits])}
+
+    def rename(self, index, case_sensitive=True):
+        """index with previous symbols replaced by approved ones; every other label is kept as it is."""
+        index = pd.Index(index)
+        mapped = self._keys(index, case_sensitive).map(self._series(case_sensitive))
+        renamed = pd.Index(np.where(pd.isna(mapped), index.to_numpy(dtype=object), mapped.to_numpy(dtype=object)),
+                           dtype=object, name=index.name)
+        return renamed
+
+
+@lru_cache(maxsize=None)
+def symbol_index(path=REFERENCE_PATH):
+    """The SymbolIndex for path, built once per process."""
+    return SymbolIndex(load_reference(path))
+
+
+############################################ Complete HGNC set #####################################################
+def parse_hgnc_complete_set(path):
+    """Previous and alias symbols of hgnc_complete_set.txt in the layout of load_reference().
+
+    Symbols that are themselves an approved symbol are left out, as renaming them would replace a current gene.
+    A symbol that is a previous or alias symbol of several genes stays in the table once per gene.
+    """
+    hgnc = pd.read_csv(path, sep="\t", dtype=str, keep_default_na=False,
+                       usecols=["hgnc_id", "symbol", "name", "location", "prev_symbol", "alias_symbol"])
+    approved = set(hgnc["symbol"])
+    tables = []
+    for column in ["prev_symbol", "alias_symbol"]:
+        table = hgnc[hgnc[column] != ""].assign(**{column: lambda x: x[column].str.split("|")}).explode(column)
+        table = table.rename(columns={column: "Previous Symbol", "symbol": "Approved symbol", "name": "Approved name",
+                                      "hgnc_id": "HGNC ID", "location": "Location"})
+        table["Previous Symbol"] = table["Previous Symbol"].str.strip()
+        tables.append(table[TABLE_COLUMNS])
+    table = pd.concat(tables, ignore_index=True)
+    return table[(table["Previous Symbol"] != "") & ~table["Previous Symbol"].isin(approved)].reset_index(drop=True)
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for block in iter(lambda: fp.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _encoded(values):
+    return np.char.encode(np.asarray(values, dtype=str), "utf-8")  # 1 byte per character for the ASCII symbols
+
+
+def _write_json(path, data):
+    """Write data to path through a temporary file, so readers see the old or the new file, never half of one."""
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as fp:
+        json.dump(data, fp)
+    os.replace(temporary, path)
+
+
+def _swap_in(building, cache_dir):
+    """Move the finished directory building to cache_dir. The files of a cache it replaces are unlinked, never
+    truncated, so processes that have them memory-mapped keep reading complete arrays."""
+    retired = building + ".old"
+    try:
+        os.replace(cache_dir, retired)
+    except FileNotFoundError:
+        retired = None
+    try:
+        os.replace(building, cache_dir)
+    except OSError:  # another process put a complete cache there in the meantime; keep that one
+        pass
+    if retired:
+        shutil.rmtree(retired, ignore_errors=True)
+
+
+@contextmanager
+def _build_lock(cache_dir):
+    """Let one process at a time build cache_dir, where the platform has fcntl; elsewhere builds may overlap,
+    which _swap_in() makes harmless, only wasteful."""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(cache_dir + ".lock", "a") as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
+
+
+def build_hgnc_cache(source, cache_dir=None):
+    """Parse source and write its lookup arrays to cache_dir (default: source + ".cache"). Returns cache_dir.
+
+    Keys are stored sorted, next to the approved symbol of each key; keys of several genes are stored apart,
+    with their genes joined by "|". The rest of the table is stored once per approved gene plus one gene
+    number per row, as names and locations repeat for every previous symbol. The arrays are written into a
+    temporary directory next to cache_dir, which then replaces cache_dir as a whole.
+    """
+    cache_dir = os.path.abspath(cache_dir or source + ".cache")
+    table = parse_hgnc_complete_set(source)
+    (exact, ambiguous), (upper, upper_ambiguous) = (_split_ambiguous(table, upper=False),
+                                                    _split_ambiguous(table, upper=True))
+    genes = table.drop_duplicates("HGNC ID")
+    arrays = {"keys": _encoded(exact.index), "values": _encoded(exact),
+              "upper_keys": _encoded(upper.index), "upper_values": _encoded(upper),
+              "ambiguous_keys": _encoded(ambiguous.index), "ambiguous_values": _encoded(ambiguous),
+              "upper_ambiguous_keys": _encoded(upper_ambiguous.index),
+              "upper_ambiguous_values": _encoded(upper_ambiguous),
+              "previous": _encoded(table["Previous Symbol"]),
+              "gene": pd.Index(genes["HGNC ID"]).get_indexer(table["HGNC ID"]).astype(np.int32)}
+    arrays.update({f"gene_{i}": _encoded(genes[c]) for i, c in enumerate(TABLE_COLUMNS[1:])})
+    building = tempfile.mkdtemp(prefix=os.path.basename(cache_dir) + ".", suffix=".tmp",
+                                dir=os.path.dirname(cache_dir))
+    try:
+        for name, values in arrays.items():
+            np.save(os.path.join(building, f"{name}.npy"), values)
+        meta = dict(_fingerprint(source), sha256=_sha256(source), version=HGNC_CACHE_VERSION, arrays=sorted(arrays))
+        _write_json(os.path.join(building, "meta.json"), meta)
+        _swap_in(building, cache_dir)
+    finally:
+        shutil.rmtree(building, ignore_errors=True)  # only still there when the swap did not happen
+    return cache_dir
+
+
+def _cache_is_fresh(source, cache_dir):
+    try:
+        with open(os.path.join(cache_dir, "meta.json")) as fp:
+            meta = json.load(fp)
+    except (OSError, ValueError):
+        return False
+    if meta.get("version") != HGNC_CACHE_VERSION:
+        return False
+    fingerprint = _fingerprint(source)
+    if all(meta.get(k) == v for k, v in fingerprint.items()):
+        return True
+    if meta.get("sha256") == _sha256(source):  # touched but unchanged, e.g. after a fresh checkout
+        meta.update(fingerprint)
+        _write_json(os.path.join(cache_dir, "meta.json"), meta)
+        return True
+    return False
+
+
+class SortedSymbolIndex:
+    """SymbolIndex backed by sorted key/value arrays, looked up with np.searchsorted.
+
+    The arrays are memory-mapped from an HGNC cache, so only the pages that lookups touch are read and
+    several worker processes share them through the page cache. table, exact and casefold are only
+    materialised when asked for.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        load = lambda name: np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode="r")
+        self._keys, self._values = load("keys"), load("values")
+        self._upper_keys, self._upper_values = load("upper_keys"), load("upper_values")
+        self._ambiguous_keys, self._ambiguous_values = load("ambiguous_keys"), load("ambiguous_values")
+        self._upper_ambiguous_keys = load("upper_ambiguous_keys")
+        self._upper_ambiguous_values = load("upper_ambiguous_values")
+        self._previous, self._gene = load("previous"), load("gene")
+        self._genes = [load(f"gene_{i}") for i in range(len(TABLE_COLUMNS) - 1)]
+
+    def __len__(self):
+        return len(self._keys)
+
+    @cached_property
+    def version(self):
+        """Hash of the source file and cache layout, so results converted with other sets can be told apart."""
+        with open(os.path.join(self.cache_dir, "meta.json")) as fp:
+            meta = json.load(fp)
+        return f"{meta['sha256'][:16]}-{meta['version']}"
+
+    @staticmethod
+    def _decoded(values):
+        return np.char.decode(np.asarray(values), "utf-8").astype(object)
+
+    @cached_property
+    def table(self):
+        table = {TABLE_COLUMNS[0]: self._decoded(self._previous)}
+        gene = np.asarray(self._gene)
+        table.update({c: self._decoded(a)[gene] for c, a in zip(TABLE_COLUMNS[1:], self._genes)})
+        return pd.DataFrame(table)
+
+    @cached_property
+    def exact(self):
+        return MappingProxyType(dict(zip(self._decoded(self._keys), self._decoded(self._values))))
+
+    @cached_property
+    def casefold(self):
+        return MappingProxyType(dict(zip(self._decoded(self._upper_keys), self._decoded(self._upper_values))))
+
+    def _positions(self, labels, case_sensitive, keys=None):
+        keys = keys if keys is not None else self._keys if case_sensitive else self._upper_keys
+        query = pd.Index(labels, dtype=object).astype(str)
+        query = _encoded(query if case_sensitive else query.str.upper())
+        if len(keys) == 0 or len(query) == 0:
+            return np.full(len(query), -1)
+        pos = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+        return np.where(keys[pos] == query, pos, -1)
+
+    def contains(self, labels, case_sensitive=True):
+        """Boolean array, True where the label is a previous symbol."""
+        return self._positions(labels, case_sensitive) >= 0
+
+    def find(self, labels, case_sensitive=True):
+        """Sorted previous symbols present in labels."""
+        labels = pd.Index(labels, dtype=object)
+        return sorted(set(labels[self.contains(labels, case_sensitive)]))
+
+    def find_ambiguous(self, labels, case_sensitive=True):
+        """{label: approved symbols} for the labels that are previous symbols of more than one gene."""
+        keys = self._ambiguous_keys if case_sensitive else self._upper_ambiguous_keys
+        values = self._ambiguous_values if case_sensitive else self._upper_ambiguous_values
+        labels = pd.Index(labels, dtype=object)
+        pos = self._positions(labels, case_sensitive, keys)
+        hits = pos >= 0
+        return {label: genes.split("|") for label, genes in zip(labels[hits], self._decoded(values[pos[hits]]))}
+
+    def rename(self, index, case_sensitive=True):
+        """index with previous symbols replaced by approved ones; every other label is kept as it is."""
+        index = pd.Index(index)
+        pos = self._positions(index, case_sensitive)
+        values = self._values if case_sensitive else self._upper_values
+        renamed = index.to_numpy(dtype=object).copy()
+        hits = pos >= 0
+        renamed[hits] = self._decoded(values[pos[hits]])
+        return pd.Index(renamed, dtype=object, name=index.name)
+
+
+@lru_cache(maxsize=None)
+def hgnc_index(source, cache_dir=None):
+    """SortedSymbolIndex for an hgnc_complete_set.txt, rebuilding its cache when the source has changed."""
+    cache_dir = os.path.abspath(cache_dir or source + ".cache")
+    if not _cache_is_fresh(source, cache_dir):
+        with _build_lock(cache_dir):
+            if not _cache_is_fresh(source, cache_dir):  # another process may have built it while this one waited
+                build_hgnc_cache(source, cache_dir)
+    return SortedSymbolIndex(cache_dir)
+
+
+def default_index():
+    """The index the tools use when none is given: the complete HGNC set named by $GENE_UPDATER_HGNC, if set,
+    otherwise the curated table."""
+    source = os.environ.get(HGNC_ENV)
+    return hgnc_index(source) if source else symbol_index()
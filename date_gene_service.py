@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+HTTP service for the Gene Updater tool, for pipelines that call the converter instead of a browser.
+
+A plain ASGI application, so any ASGI server runs it; with uvicorn:
+
+    uvicorn date_gene_service:app --host 0.0.0.0 --port 8000 --workers 4
+    python date_gene_service.py --port 8000 --workers 4
+
+Each worker loads the HGNC reference once, at start-up, and keeps it for every request; set GENE_UPDATER_HGNC
+(or --hgnc) to serve a hgnc_complete_set.txt instead of the curated reference. Endpoints:
+  GET  /health   status and version of the loaded reference
+  GET  /metrics  request, error, batch and latency counters of this worker, as JSON
+  POST /symbols  gene symbols as a JSON array, {"symbols": [...], "descriptions": [...]} or text with one symbol
+                 per line; returns {"symbols": [new symbols, in order], "report": {...}}
+  POST /convert  a whole file as CSV or TSV (plain or gzip/zstd compressed), Parquet, Feather, xlsx or JSON
+                 records; returns the cleaned file in the same format (or ?output=tsv.zst, parquet, ... any of
+                 date_gene_io.EXPORT_FORMATS) with a summary of the report in the X-Conversion-Report header.
+                 ?output=json returns {"report": {...}, "data": {"index", "columns", "data"}}. The format is taken
+                 from the first bytes of the body, else from ?format= or the Content-Type
+The conversion options are query parameters named as the fields of engine.ConversionOptions (mar_resolution,
+mar01_first, mar02_first, date_format, date_info, row_order, duplicates); as in the CLI, Mar-01/Mar-02 pairs are
+resolved by their description and numeric dates in the layout that fits them unless told otherwise.
+
+Small symbol requests are micro-batched: they wait in a queue for at most max_delay seconds, and the symbols of up
+to max_batch of them are looked up together with engine.relabel_batch, which costs about as much as one request.
+File bodies are streamed into a temporary file (in memory up to SPOOL_BYTES) and converted in a thread, through
+the conversion cache, so the event loop keeps answering while a large file is converted.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+from dataclasses import fields
+from urllib.parse import parse_qsl
+
+import pandas as pd
+
+import date_gene_cache as gene_cache
+import date_gene_engine as engine
+import date_gene_io as gene_io
+import date_gene_reference as gene_reference
+
+
+MAX_BATCH = 256  # requests looked up together
+MAX_BATCH_SYMBOLS = 1000  # larger symbol requests skip the queue
+MAX_DELAY = 0.002  # seconds a request may wait for others to join its batch
+MAX_BODY = 1 << 30
+SPOOL_BYTES = 16 << 20
+HGNC_ENV = "GENE_UPDATER_HGNC"  # hgnc_complete_set.txt for the module-level app, instead of the curated reference
+RESPONSE_CHUNK = 1 << 20
+FORMATS = {"csv": "text/csv", "tsv": "text/tab-separated-values", "parquet": "application/vnd.apache.parquet",
+           "feather": "application/vnd.apache.arrow.file",
+           "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "json": "application/json"}
+COMPRESSED_TYPES = {"gzip": "application/gzip", "zstd": "application/zstd", "bz2": "application/x-bzip2",
+                    "xz": "application/x-xz"}
+CONTENT_TYPES = {"text/csv": "csv", "application/csv": "csv", "text/tab-separated-values": "tsv",
+                 "application/vnd.apache.parquet": "parquet", "application/x-parquet": "parquet",
+                 "application/parquet": "parquet", "application/vnd.apache.arrow.file": "feather",
+                 FORMATS["xlsx"]: "xlsx", "application/json": "json"}
+OUTPUTS = (*gene_io.EXPORT_FORMATS, "json")
+SERVICE_DEFAULTS = {"mar_resolution": "description", "date_format": engine.AUTO_DATE_FORMAT}
+OPTION_CHOICES = {"mar_resolution": engine.MAR_RESOLUTIONS, "mar01_first": tuple(engine.MAR01_GENES),
+                  "mar02_first": tuple(engine.MAR02_GENES),
+                  "date_format": (engine.AUTO_DATE_FORMAT, *engine.DATE_FORMATS), "date_info": tuple(engine.DATE_INFO),
+                  "row_order": engine.ROW_ORDERS, "duplicates": engine.DUPLICATE_STRATEGIES}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_options(query):
+    """ConversionOptions from the query parameters, with the service defaults for those not given."""
+    values = dict(SERVICE_DEFAULTS)
+    for name, value in query.items():
+        if name in OPTION_CHOICES:
+            if value not in OPTION_CHOICES[name]:
+                raise HTTPError(400, f"{name} must be one of {list(OPTION_CHOICES[name])}")
+            values[name] = value
+    if values["mar_resolution"] == "mapping":
+        raise HTTPError(400, "mar_resolution=mapping is not available over HTTP; use order or description")
+    return engine.ConversionOptions(**values)
+
+
+def _options_key(options):
+    return tuple(getattr(options, f.name) for f in fields(options) if f.name != "mar_mapping")
+
+
+def parse_symbols(body, content_type):
+    """(symbols, descriptions or None) from a /symbols body."""
+    if content_type == "application/json" or body[:1] in (b"[", b"{"):
+        try:
+            data = json.loads(body)
+        except ValueError as error:
+            raise HTTPError(400, f"invalid JSON: {error}")
+        descriptions = None
+        if isinstance(data, dict):
+            data, descriptions = data.get("symbols"), data.get("descriptions")
+        if not isinstance(data, list) or not all(isinstance(s, str) for s in data):
+            raise HTTPError(400, 'expected a JSON array of symbols or {"symbols": [...]}')
+        if descriptions is not None and (not isinstance(descriptions, list) or len(descriptions) != len(data)):
+            raise HTTPError(400, "descriptions must be a list as long as symbols")
+        return data, descriptions
+    try:
+        text = body.decode("utf-8")
+    except UnicodeDecodeError:
+        raise HTTPError(400, "the body is not UTF-8 text")
+    return [line.strip() for line in text.splitlines() if line.strip()], None
+
+
+def body_format(src, declared):
+    """gene_io.FileFormat of the body src, or "json". The first bytes decide Parquet, Feather, xlsx and the
+    compression; declared, from ?format= or the Content-Type, whether text is CSV or TSV."""
+    if declared == "json":
+        return declared
+    detected = gene_io.detect_format(src, name=f"body.{declared}" if declared in gene_io.TEXT_FORMATS else None)
+    plain_text = detected is not None and detected.kind in gene_io.TEXT_FORMATS and detected.compression is None
+    if declared is None and (detected is None or plain_text):
+        raise HTTPError(415, f"send the file as one of {list(FORMATS)}, by Content-Type or ?format=")
+    if declared is not None and (detected is None or detected.kind != declared):
+        raise HTTPError(400, f"the body is not a {declared} file")
+    return detected
+
+
+def read_frame(src, fmt):
+    """The uploaded file src (a binary file object) as a dataframe with the gene names as index."""
+    if fmt == "json":
+        df = pd.read_json(src, orient="records")
+        return df.set_index(df.columns[0])
+    return gene_io.read_table(src, fmt)
+
+
+def write_frame(df, fmt):
+    return gene_io.write_table(df, io.BytesIO(), fmt).getvalue()
+
+
+def report_summary(report):
+    """The parts of a report small enough for a response header."""
+    return {"status": report.status, "rows_in": report.rows_in, "rows_out": report.rows_out,
+            "changes": report.changes, "missing": len(report.missing), "needs_review": report.needs_review,
+            "ambiguous": len(report.ambiguous)}
+
+
+def _json(data):
+    return json.dumps(data, separators=(",", ":"), default=str).encode()
+
+
+class ConversionService:
+    """ASGI application converting gene files and symbol lists against one reference per worker.
+
+    reference is a SymbolIndex (or SortedSymbolIndex); by default the HGNC table given by hgnc, else the
+    curated reference, is loaded when the server starts. max_delay=0 still batches whatever requests are
+    queued, without waiting for more.
+    """
+
+    def __init__(self, reference=None, hgnc=None, cache=None, max_batch=MAX_BATCH, max_batch_symbols=MAX_BATCH_SYMBOLS,
+                 max_delay=MAX_DELAY, max_body=MAX_BODY):
+        self.reference, self.hgnc = reference, hgnc
+        self.cache = gene_cache.default_cache() if cache is None else cache
+        self.max_batch, self.max_batch_symbols = max_batch, max_batch_symbols
+        self.max_delay, self.max_body = max_delay, max_body
+        self.started = time.time()
+        self.requests, self.errors, self.seconds = Counter(), Counter(), Counter()
+        self.batches = self.batched_requests = self.batched_symbols = self.largest_batch = 0
+        self._queue = self._batcher = None
+        self._starting = None  # asyncio.Lock, made in the server's event loop
+
+    async def startup(self):
+        """Load the reference and start the batcher, once however many first requests arrive together."""
+        if self._starting is None:  # no await before this, so concurrent first requests share one lock
+            self._starting = asyncio.Lock()
+        async with self._starting:
+            if self._batcher is not None:
+                return
+            if self.reference is None:
+                self.reference = await asyncio.to_thread(_load_reference, self.hgnc)
+            self._queue = asyncio.Queue()
+            self._batcher = asyncio.create_task(self._run_batches())
+
+    async def shutdown(self):
+        if self._batcher is not None:
+            self._batcher.cancel()
+            self._batcher = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+        if self._batcher is None:  # a server without lifespan events
+            await self.startup()
+        route = scope["path"].rstrip("/") or "/"
+        start = time.perf_counter()
+        try:
+            handler = {"/health": self.health, "/metrics": self.metrics, "/symbols": self.symbols,
+                       "/convert": self.convert}.get(route)
+            if handler is None:
+                raise HTTPError(404, f"no endpoint {route}")
+            if (scope["method"] == "GET") != (route in ("/health", "/metrics")):
+                raise HTTPError(405, f"{scope['method']} is not allowed on {route}")
+            query = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+            status, headers, body = await handler(scope, receive, query)
+        except HTTPError as error:
+            status, headers, body = error.status, [], _json({"error": str(error)})
+        except Exception as error:  # reported to the client, as one bad file should not look like a dead service
+            status, headers, body = 500, [], _json({"error": f"{type(error).__name__}: {error}"})
+        self.requests[route] += 1
+        self.seconds[route] += time.perf_counter() - start
+        if status >= 400:
+            self.errors[route] += 1
+            headers = [(b"content-type", b"application/json")]
+        await send({"type": "http.response.start", "status": status,
+                    "headers": headers + [(b"content-length", str(len(body)).encode())]})
+        for at in range(0, max(len(body), 1), RESPONSE_CHUNK):
+            await send({"type": "http.response.body", "body": body[at:at + RESPONSE_CHUNK],
+                        "more_body": at + RESPONSE_CHUNK < len(body)})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as error:
+                    await send({"type": "lifespan.startup.failed", "message": str(error)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _body(self, receive, spool=False):
+        """The request body, as bytes or, with spool, in a temporary file that spills to disk past SPOOL_BYTES."""
+        out = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) if spool else io.BytesIO()
+        size, more = 0, True
+        while more:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise HTTPError(400, "the client disconnected")
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body:
+                raise HTTPError(413, f"the body is larger than {self.max_body} bytes")
+            out.write(chunk)
+            more = message.get("more_body", False)
+        if spool:
+            out.seek(0)
+            return out
+        return out.getvalue()
+
+    ######################################################## endpoints ##############################################
+    async def health(self, scope, receive, query):
+        return 200, [(b"content-type", b"application/json")], _json(
+            {"status": "ok", "reference": self.reference.version, "symbols": len(self.reference),
+             "uptime": time.time() - self.started})
+
+    async def metrics(self, scope, receive, query):
+        return 200, [(b"content-type", b"application/json")], _json({
+            "uptime": time.time() - self.started, "requests": dict(self.requests), "errors": dict(self.errors),
+            "seconds": dict(self.seconds), "batches": self.batches, "batched_requests": self.batched_requests,
+            "batched_symbols": self.batched_symbols, "largest_batch": self.largest_batch,
+            "queued": self._queue.qsize(), "cache": {"entries": len(self.cache), "hits": self.cache.hits,
+                                                     "misses": self.cache.misses}})
+
+    async def symbols(self, scope, receive, query):
+        options = parse_options(query)
+        symbols, descriptions = parse_symbols(await self._body(receive), _content_type(scope))
+        if descriptions is not None or len(symbols) > self.max_batch_symbols:
+            new, report = await asyncio.to_thread(engine.relabel, symbols, options, self.reference, descriptions)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            await self._queue.put((symbols, options, future))
+            new, report = await future
+        new = [None if pd.isna(label) else label for label in new]
+        return 200, [(b"content-type", b"application/json")], _json({"symbols": new, "report": report.to_dict()})
+
+    async def convert(self, scope, receive, query):
+        options = parse_options(query)
+        declared = query.get("format") or CONTENT_TYPES.get(_content_type(scope))
+        if declared is not None and declared not in FORMATS:
+            raise HTTPError(415, f"format must be one of {list(FORMATS)}")
+        src = await self._body(receive, spool=True)
+        try:
+            fmt = body_format(src, declared)
+            output = query.get("output", fmt if fmt == "json" else fmt.extension[1:])
+            if output not in OUTPUTS:
+                raise HTTPError(400, f"output must be one of {list(OUTPUTS)}")
+            cleaned, report = await asyncio.to_thread(self._convert, src, fmt, options)
+        finally:
+            src.close()
+        if output == "json":
+            body = await asyncio.to_thread(lambda: _json({"report": report.to_dict(),
+                                                          "data": json.loads(cleaned.to_json(orient="split"))}))
+            content_type = FORMATS["json"]
+        else:
+            output = gene_io.format_from_name("cleaned." + output)
+            body = await asyncio.to_thread(write_frame, cleaned, output)
+            content_type = COMPRESSED_TYPES.get(output.compression) or FORMATS[output.kind]
+        return 200, [(b"content-type", content_type.encode()),
+                     (b"x-conversion-report", _json(report_summary(report)))], body
+
+    def _convert(self, src, fmt, options):
+        try:
+            df = read_frame(src, fmt)
+        except Exception as error:
+            raise HTTPError(400, f"could not read the body: {error}")
+        return self.cache.convert(df, options, self.reference)
+
+    ######################################################## batching ###############################################
+    async def _run_batches(self):
+        """Take queued symbol requests, up to max_batch at a time, and answer them with one relabel_batch() call
+        per set of options. Requests keep arriving while a batch runs in its thread, so under load the next
+        batch is ready without waiting."""
+        while True:
+            batch = [await self._queue.get()]
+            if self.max_delay > 0 and self._queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.max_delay)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            groups = {}
+            for item in batch:
+                groups.setdefault(_options_key(item[1]), []).append(item)
+            for items in groups.values():
+                try:
+                    results = await asyncio.to_thread(engine.relabel_batch, [i[0] for i in items], items[0][1],
+                                                      self.reference)
+                except Exception as error:
+                    for _, _, future in items:
+                        if not future.done():
+                            future.set_exception(error)
+                    continue
+                for (_, _, future), result in zip(items, results):
+                    if not future.done():  # the client may have gone
+                        future.set_result(result)
+            self.batches += 1
+            self.batched_requests += len(batch)
+            self.batched_symbols += sum(len(i[0]) for i in batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+
+
+def _load_reference(hgnc):
+    return gene_reference.hgnc_index(hgnc) if hgnc else gene_reference.default_index()
+
+
+def _content_type(scope):
+    for name, value in scope.get("headers", []):
+        if name == b"content-type":
+            return value.decode("latin-1").split(";")[0].strip().lower()
+    return None
+
+
+app = ConversionService(hgnc=os.environ.get(HGNC_ENV))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="date_gene_service", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="processes, each with its own copy of the reference")
+    parser.add_argument("--hgnc", help="hgnc_complete_set.txt to use instead of the curated reference")
+    args = parser.parse_args(argv)
+    try:
+        import uvicorn
+    except ImportError:
+        parser.error("the service needs an ASGI server: pip install uvicorn")
+    if args.hgnc:
+        os.environ[HGNC_ENV] = os.path.abspath(args.hgnc)  # read by every worker as it imports the app
+    _load_reference(os.environ.get(HGNC_ENV))  # build a missing or stale HGNC cache once, before the workers start
+    uvicorn.run("date_gene_service:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
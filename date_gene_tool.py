@@ -4,16 +4,17 @@
 import pandas as pd
 import numpy as np
 import re
-import inflect
 import base64
 from io import BytesIO
-import zipfile
-import dateparser
 from datetime import datetime
 
 import streamlit as st
 from streamlit_tags import st_tags, st_tags_sidebar
 
+import date_gene_engine as engine
+import date_gene_io as gene_io
+import date_gene_cache as gene_cache
+
 
 st.title("Gene Updater")
 st.subheader("A Streamlit web tool that autocorrects and updates for Excel misidentified gene names")
@@ -36,7 +37,7 @@ if st.sidebar.checkbox("Read the Docs", value=False):
         ## Instructions for using web tool
 
         ### Data Upload
-        Users can upload a single or multiple .csv or .xlsx files. Ensure that the first column contains the gene names. If the gene file contains Mar-01 and Mar-02, we encourage having a gene description column on the second column so that the identities of MARCH1/MARC1 and MARCH2/MARC2 can be easily resolved with the web tool. A checkbox is provided for users to inspect their uploaded data. If no data is uploaded, a demo dataset consisting of a restricted list of genes are pre-loaded. Users may use the pre-loaded demo dataset to explore the features and functionalities of the web tool.
+        Users can upload a single or multiple .csv, .tsv, .parquet, .feather or .xlsx files; .csv and .tsv files may be gzip or zstd compressed (.csv.gz, .tsv.zst). Ensure that the first column contains the gene names. If the gene file contains Mar-01 and Mar-02, we encourage having a gene description column on the second column so that the identities of MARCH1/MARC1 and MARCH2/MARC2 can be easily resolved with the web tool. A checkbox is provided for users to inspect their uploaded data. If no data is uploaded, a demo dataset consisting of a restricted list of genes are pre-loaded. Users may use the pre-loaded demo dataset to explore the features and functionalities of the web tool.
         
         ### Updating Outdated Date-related Gene Names
         If the first column contains the old gene names, these genes will be updated to the new gene names using the webtool. If the first column contains dates, they will be converted to the updated gene names, with the exception of Mar-01 and Mar-02 as these terms can be mapped to more than one gene.
@@ -54,7 +55,7 @@ if st.sidebar.checkbox("Read the Docs", value=False):
 
 ################################################# File Uploader ########################################################
 df_query = st.sidebar.file_uploader(
-    'Upload your .csv/.xlsx files here with the first column as gene names. If no data is uploaded, a demo dataset will be pre-loaded',
+    'Upload your .csv/.tsv (optionally .gz/.zst compressed), .parquet, .feather or .xlsx files here with the first column as gene names. If no data is uploaded, a demo dataset will be pre-loaded',
     accept_multiple_files=True)
 
 df_dict = {}
@@ -62,17 +63,25 @@ df_dict = {}
 
 if len(df_query) != 0:
     for d in df_query:
-        head, sep, tail = str(d.name).partition(".")
-        if tail == 'csv':
-            data = st.experimental_memo(pd.read_csv)(d, index_col=0)
-            df_dict[head] = data
+        # the format is told by the first bytes and the full extension, so sample.counts.csv.gz is a gzipped csv
+        fmt = gene_io.detect_format(d, d.name)
+        if fmt is None:
+            st.warning(f"{d.name} was skipped: it is not a .csv/.tsv, .parquet, .feather or .xlsx file")
+        elif fmt.kind != 'xlsx':
+            try:
+                data = st.experimental_memo(gene_io.read_table)(d, fmt)
+            except ValueError as error:  # e.g. a .csv that is not UTF-8 text
+                st.warning(f"{d.name} was skipped: it could not be read as a {fmt.kind} file ({error})")
+                continue
+            df_dict[gene_io.stem(d.name)] = data
             # df_names.append(head)
 
-        elif tail == 'xlsx':
-            x = st.experimental_memo(pd.read_excel)(d, index_col=0, sheet_name=None, engine='openpyxl')
-            selected_sheet = st.sidebar.multiselect(label="Select which sheet to read in", options=x.keys())
+        else:
+            # only the sheet names are read up front; each sheet is parsed once it is selected
+            sheets = st.experimental_memo(gene_io.excel_sheet_names)(d)
+            selected_sheet = st.sidebar.multiselect(label="Select which sheet to read in", options=sheets)
             for i in selected_sheet:
-                data = x[i]
+                data = st.experimental_memo(gene_io.read_excel_sheet)(d, i)
                 df_dict[i] = data
 else:
     x = pd.read_csv("demo.csv", index_col = 0) # github
@@ -90,18 +99,23 @@ if st.sidebar.checkbox("Show original datasets"):
 
 ################################################ for df download #######################################################
 def zip_file(dfs, keys):
-    with zipfile.ZipFile("cleanedfiles.zip", 'w') as compress:
-        for df, k in zip(dfs, keys):
-            file = df.to_csv().encode('utf-8')
-            compress.writestr(f"cleaned_{k}.csv", file)
-
-    with open("cleanedfiles.zip", "rb") as fp:
-          btn = st.download_button(
-              label="Download ZIP",
-              data=fp,
-              file_name="cleanedfiles.zip",
-              mime="application/octet-stream"
-              )
+    # the archive is only built when the user asks for it, in memory for this session, so no file is written to
+    # the working directory and concurrent sessions never share one
+    formats = st.multiselect("Formats to include in the ZIP", options=list(gene_io.EXPORT_FORMATS), default=["csv"])
+    level = st.slider("ZIP compression level (higher is smaller but slower)", min_value=0, max_value=9, value=6)
+    if st.button("Prepare ZIP") and len(formats) != 0:
+        try:
+            archive = gene_io.write_zip(dict(zip(keys, dfs)), BytesIO(), formats=formats, compresslevel=level)
+        except ImportError as e:
+            st.error(f"{e}. Install it to export these formats, or choose csv only.")
+            return
+        archive.seek(0)
+        btn = st.download_button(
+            label="Download ZIP",
+            data=archive,
+            file_name="cleanedfiles.zip",
+            mime="application/zip"
+            )
 
 # def to_excel(df):
 #     output = BytesIO()
@@ -124,87 +138,32 @@ def zip_file(dfs, keys):
 #            f'📥 Download cleaned files as Excel 📥</a>' # decode b'abc' => abc
 
 ########################################### HGNC Reference Table ####################################################
-@st.cache
-def clean_ref():
-    # for_ref = pd.read_csv("/Users/clara/Dropbox/Streamlit_app/Date Gene Converter/hgnc-symbol-check.csv") # local
-    for_ref = pd.read_csv("hgnc-symbol-check2.csv") # github
-    for_ref.reset_index(drop=True,inplace=True)
-    for_ref.columns = for_ref.iloc[0,:]
-    for_ref.drop(index=0, inplace=True)
-    for_ref.drop(columns="Match type", inplace=True)
-    for_ref.rename(columns={"Input":"Previous Symbol"}, inplace=True)
-    return for_ref
-reference_symbols = clean_ref()
+reference = engine.default_index()  # built once per process and shared by every session
+reference_symbols = reference.table
+conversions = gene_cache.default_cache()  # converted files, shared by every session and kept across reruns
 
 if st.sidebar.checkbox("HGNC symbol reference", value=False):
     st.subheader("HGNC Reference for Affected Gene Symbols")
     st.dataframe(reference_symbols)
 
 ######################################### Variables used throughout code #############################################
-p = inflect.engine()
 cleaned_dict = {}
 
-corrected = {"DEC-01_1st": "DELEC1", "01-DEC_1st":"DELEC1", "MAR-03_1st": "MARCHF3", "03-MAR_1st":"MARCHF3",
-             "MAR-04_1st": "MARCHF4", "04-MAR_1st":"MARCHF4", "MAR-05_1st": "MARCHF5", "05-MAR_1st":"MARCHF5",
-             "MAR-06_1st": "MARCHF6", "06-MAR_1st":"MARCHF6", "MAR-07_1st": "MARCHF7", "07-MAR_1st":"MARCHF7",
-             "MAR-08_1st": "MARCHF8", "08-MAR_1st":"MARCHF8", "MAR-09_1st": "MARCHF9", "09-MAR_1st":"MARCHF9",
-             "MAR-10_1st": "MARCHF10", "10-MAR_1st":"MARCHF10", "MAR-11_1st": "MARCHF11", "11-MAR_1st":"MARCHF11",
-             "SEP-15_1st": "SELENOF", "15_SEP_1st":"SELENOF", "SEP-01_1st": "SEPTIN1", "01-SEP_1st":"SEPTIN1",
-             "SEP-02_1st": "SEPTIN2", "02-SEP_1st":"SEPTIN2", "SEP-03_1st": "SEPTIN3", "03-SEP_1st":"SEPTIN3",
-             "SEP-04_1st": "SEPTIN4", "04-SEP_1st":"SEPTIN4", "SEP-05_1st": "SEPTIN5", "05-SEP_1st":"SEPTIN5",
-             "SEP-06_1st": "SEPTIN6", "06-SEP_1st":"SEPTIN6", "SEP-07_1st": "SEPTIN7", "07-SEP_1st":"SEPTIN7",
-             "SEP-08_1st": "SEPTIN8", "08-SEP_1st":"SEPTIN8", "SEP-09_1st": "SEPTIN9", "09-SEP_1st":"SEPTIN9",
-             "SEP-10_1st": "SEPTIN10", "10-SEP_1st":"SEPTIN10", "SEP-11_1st": "SEPTIN11", "11-SEP_1st":"SEPTIN11",
-             "SEP-12_1st": "SEPTIN12", "12-SEP_1st":"SEPTIN12", "SEP-13_1st":"SEPTIN7P2", "13-SEP_1st":"SEPTIN7P2",
-             "SEP-14_1st": "SEPTIN14", "14-SEP_1st":"SEPTIN14",
-
-             "Dec-01_1st": "DELEC1", "01-Dec_1st":"DELEC1", "Mar-03_1st": "MARCHF3", "03-Mar_1st":"MARCHF3",
-             "Mar-04_1st": "MARCHF4", "04-Mar_1st":"MARCHF4", "Mar-05_1st": "MARCHF5", "05-Mar_1st":"MARCHF5",
-             "Mar-06_1st": "MARCHF6", "06-Mar_1st":"MARCHF6", "Mar-07_1st": "MARCHF7", "07-Mar_1st":"MARCHF7",
-             "Mar-08_1st": "MARCHF8", "08-Mar_1st":"MARCHF8", "Mar-09_1st": "MARCHF9", "09-Mar_1st":"MARCHF9",
-             "Mar-10_1st": "MARCHF10", "10-Mar_1st":"MARCHF10", "Mar-11_1st": "MARCHF11", "11-Mar_1st":"MARCHF11",
-             "Sep-15_1st": "SELENOF", "15_Sep_1st":"SELENOF", "Sep-01_1st": "SEPTIN1", "01-Sep_1st":"SEPTIN1",
-             "Sep-02_1st": "SEPTIN2", "02-Sep_1st":"SEPTIN2", "Sep-03_1st": "SEPTIN3", "03-Sep_1st":"SEPTIN3",
-             "Sep-04_1st": "SEPTIN4", "04-Sep_1st":"SEPTIN4", "Sep-05_1st": "SEPTIN5", "05-Sep_1st":"SEPTIN5",
-             "Sep-06_1st": "SEPTIN6", "06-Sep_1st":"SEPTIN6", "Sep-07_1st": "SEPTIN7", "07-Sep_1st":"SEPTIN7",
-             "Sep-08_1st": "SEPTIN8", "08-Sep_1st":"SEPTIN8", "Sep-09_1st": "SEPTIN9", "09-Sep_1st":"SEPTIN9",
-             "Sep-10_1st": "SEPTIN10", "10-Sep_1st":"SEPTIN10", "Sep-11_1st": "SEPTIN11", "11-Sep_1st":"SEPTIN11",
-             "Sep-12_1st": "SEPTIN12", "12-Sep_1st":"SEPTIN12", "Sep-13_1st":"SEPTIN7P2", "13-Sep_1st":"SEPTIN7P2",
-             "Sep-14_1st": "SEPTIN14", "14-Sep_1st":"SEPTIN14"
-                 }
-
-misidentified = None
-############################### Path after initial regex ############################################################
-
 ################ Contains dates and March-01/March-02 and have to be resolved ####################
-def march_resolver(dfs):
-    find = [g for g in dfs.index.tolist() if re.search("^MAR-|^APR-|^SEPT?-|^OCT-|^DEC-", g, flags=re.I)]
-    global misidentified
-    misidentified = ";".join(find)
-    formatted = {}
-    for d in find:
-        zero_pad = re.search("[0-9]{2}", d)
-        num = re.findall("[0-9]*", d)
-        og_num = [x for x in num if x != ""]
-        month = re.findall("[A-Za-z]*", d)
-        og_month = [x for x in month if x != ""]
-        if not zero_pad:
-            a = f"{og_month[0]}-0{og_num[0]}" # still can't use dateparser bc time fmt requires zero-padded number
-            formatted[d] = a
-        else:
-            a = f"{og_month[0]}-{og_num[0]}"
-            formatted[d] = a
-
-    each_df_exp = st.expander(f"Expand to resolve naming issues for {k} dataframe", expanded=False)
-    found = df.loc[find]
-    found.rename(index=formatted, inplace=True)
-    found = found.drop_duplicates() # ensures that there aren't duplicate rows (not just duplicate row names)
-    found.reset_index(drop=False, inplace=True)
-    index_name = found.columns.tolist()[0]
-    found[index_name] += found.groupby(index_name).cumcount().add(1).map(p.ordinal).radd('_')
-    found.set_index(index_name, inplace=True)
-    mar1 = [f for f in found.index.tolist() if re.search("Mar-0?1_1st|0?1-Mar_1st|Mar-0?1_2nd|Mar-0?1_2nd", f, flags=re.I)]
-    if len(mar1) !=0:
+def march_resolver(k, found, options):
+    # pairs whose gene descriptions match the HGNC approved names are resolved automatically;
+    # the select boxes are only shown for the pairs that the descriptions could not decide
+    options.mar_resolution = "description"
+    descriptions = engine.description_column(found)
+    _, choices = engine.resolve_march(found.index.tolist(), [] if descriptions is None else descriptions.tolist(), reference)
+    automatic = {c.date: c for c in choices if c.automatic}
+    each_df_exp = st.expander(f"Expand to resolve naming issues for {k} dataframe", expanded=len(automatic) < len(choices))
+    for choice in automatic.values():
+        each_df_exp.success(f"{choice.date} genes of {k} dataframe matched from the gene description ({choice.method} match): "
+                            + ", ".join(f"{label} → {gene}" for label, gene in zip(choice.labels, choice.genes)))
+
+    mar1 = [f for f in found.index.tolist() if engine.MAR01_REGEX.search(f)]
+    if len(mar1) !=0 and "Mar-01" not in automatic:
         mar1_df = found.loc[mar1]
 
         with each_df_exp:
@@ -216,19 +175,11 @@ def march_resolver(dfs):
             first_mar01_fx = st.selectbox(f"Select the name and function that {mar1[0]} corresponds to for {k} dataframe",
                                           options=["MTARC1: mitochondrial amidoxime reducing component 1",
                                                   "MARCHF1: membrane associated ring-CH-type finger 1"])
-        # function below can still apply to genes with only 1 MAR-01 gene because the dictionary will only match those found in the data
-        if first_mar01_fx == "MTARC1: mitochondrial amidoxime reducing component 1":
-            first_mar01 = "MTARC1"
-            second_mar01 = "MARCHF1"
-        elif first_mar01_fx == "MARCHF1: membrane associated ring-CH-type finger 1":
-            first_mar01 = "MARCHF1"
-            second_mar01 = "MTARC1"
-
-        corrected["MAR-01_1st"], corrected['Mar-01_1st'], corrected["01-MAR_1st"], corrected["01-Mar_1st"] = first_mar01, first_mar01, first_mar01, first_mar01
-        corrected["MAR-01_2nd"], corrected["Mar-01_2nd"], corrected["01-MAR_2nd"], corrected["01-Mar_2nd"] = second_mar01, second_mar01, second_mar01, second_mar01
-
-    mar2 = [f for f in found.index.tolist() if re.search("Mar-0?2_1st|0?2-Mar_1st|Mar-0?2_2nd|02-Mar_2nd", f, flags=re.I)]
-    if len(mar2) !=0:
+        # the choice can still apply to genes with only 1 MAR-01 gene because the engine only renames those found in the data
+        options.mar01_first = first_mar01_fx.partition(":")[0]
+
+    mar2 = [f for f in found.index.tolist() if engine.MAR02_REGEX.search(f)]
+    if len(mar2) !=0 and "Mar-02" not in automatic:
         mar2_df = found.loc[mar2]
 
         each_df_exp.write(f"**MAR02 Genes: {k} Dataframe**")
@@ -241,123 +192,29 @@ def march_resolver(dfs):
                                       options=[
                                           "MTARC2: mitochondrial amidoxime reducing component 2",
                                           "MARCHF2: membrane associated ring-CH-type finger 2"])
-
-        if first_mar02_fx == "MTARC2: mitochondrial amidoxime reducing component 2":
-            first_mar02 = "MTARC2"
-            second_mar02 = "MARCHF2"
-        elif first_mar02_fx == "MARCHF2: membrane associated ring-CH-type finger 2":
-            first_mar02 = "MARCHF2"
-            second_mar02 = "MTARC2"
-
-        corrected["MAR-02_1st"], corrected["Mar-02_1st"], corrected["02-MAR_1st"], corrected["02-Mar_1st"]  = first_mar02, first_mar02, first_mar02, first_mar02
-        corrected["MAR-02_2nd"], corrected["Mar-02_2nd"], corrected["02-MAR_2nd"], corrected["02-Mar_2nd"] = second_mar02, second_mar02, second_mar02, second_mar02
-
-    # else:
-    #     corrected["MAR-01_1st"], corrected['Mar-01_1st'], corrected["01-MAR_1st"], corrected["01-Mar_1st"] = first_mar01, first_mar01, first_mar01, first_mar01
-    #     corrected["MAR-01_2nd"], corrected["Mar-01_2nd"], corrected["01-MAR_2nd"], corrected["01-Mar_2nd"] = second_mar01, second_mar01, second_mar01, second_mar01
-    #     corrected["MAR-02_1st"], corrected["Mar-02_1st"], corrected["02-MAR_1st"], corrected["02-Mar_1st"]  = first_mar02, first_mar02, first_mar02, first_mar02
-    #     corrected["MAR-02_2nd"], corrected["Mar-02_2nd"], corrected["02-MAR_2nd"], corrected["02-Mar_2nd"] = second_mar02, second_mar02, second_mar02, second_mar02
-
-    found["Gene"] = pd.Series(corrected)  # in order to rename just change this to found.rename(corrected)
-    found.reset_index(drop=True, inplace=True)  # remove the gene index with the dates
-    found.rename(columns={"Gene": "gene"}, inplace=True)  # rename the incoming column to be used as index
-    found.set_index('gene', inplace=True)  # set the index of these date genes using corrected names
-    dfs = dfs.drop(index=find)  # drop the date genes from the main df
-    df2 = pd.concat([dfs, found], axis=0)  # join these genes back to the main df
-    df2.sort_index(axis=0, ascending=True, inplace=True)  # sort alphabetically
-    df2.reset_index(drop=False, inplace=True)
-    df2.rename(columns={'index': index_name}, inplace=True)
-    df2.set_index(index_name, inplace=True)
-    cleaned_dict[k] = df2
-    return
-
-############ Contains dates but no march-01/march-02 and thus nothing to resolve ##############
-def date_resolver(df, date_search):
-    global misidentified
-    misidentified = ";".join(date_search)
-    formatted = {}
-    for d in date_search:
-        zero_pad = re.search("[0-9]{2}", d)
-        num = re.findall("[0-9]*", d)
-        og_num = [x for x in num if x != ""]
-        month = re.findall("[A-Za-z]*", d)
-        og_month = [x for x in month if x != ""]
-        if not zero_pad:
-            a = f"{og_month[0]}-0{og_num[0]}" # still can't use dateparser as python time fmts only read zero-padded no.
-            formatted[d] = a
-        else:
-            a = f"{og_month[0]}-{og_num[0]}"
-            formatted[d] = a
-    found = df.loc[date_search]
-    found.rename(index=formatted, inplace=True)
-    found = found.drop_duplicates()  # ensures that there aren't duplicate rows (not just duplicate row names)
-    found.reset_index(drop=False, inplace=True)
-    index_name = found.columns.tolist()[0]
-    found[index_name] += found.groupby(index_name).cumcount().add(1).map(p.ordinal).radd('_')
-    found.set_index(index_name, inplace=True)
-    found.rename(index=corrected, inplace=True)  # in order to rename just change this to found.rename(corrected)
-    df = df.drop(index=date_search)  # drop the date genes from the main df
-    df2 = pd.concat([df, found], axis=0)  # join these genes back to the main df
-    df2.sort_index(axis=0, ascending=True, inplace=True)  # sort alphabetically
-    cleaned_dict[k] = df2
-    return
+        options.mar02_first = first_mar02_fx.partition(":")[0]
+    return options
 
 ############################## Dates are only numbers ##########################################
-def numeric_date(k,df,numdate):
-    num_exp = st.expander(f"Expand if {k}'s date format is numerical (eg. yyyy/mm/dd)")
-    date_fmt = num_exp.radio(f"Select the format that {k} dataframe is in",
-                  options=["yyyy-dd-mm", "yyyy-mm-dd", "dd-mm-yyyy", "mm-dd-yyyy"])
-    info_stored = num_exp.radio(f"Select how {k}'s dates should be read to derive gene names (Hover '?' for help)",
+def numeric_date(k, df, options):
+    numdate = engine.find_numeric_dates(df.index.tolist())
+    inferred = engine.infer_date_format(numdate)  # preselected when only one layout fits every date
+    layouts = list(engine.DATE_FORMATS)
+    num_exp = st.expander(f"Expand if {k}'s date format is numerical (eg. yyyy/mm/dd)", expanded=inferred is None)
+    options.date_format = num_exp.radio(f"Select the format that {k} dataframe is in",
+                  options=layouts, index=layouts.index(inferred) if inferred else 0)
+    if inferred:
+        num_exp.success(f"{k} dataframe's dates are only valid as {inferred}, so this format has been selected.")
+    options.date_info = num_exp.radio(f"Select how {k}'s dates should be read to derive gene names (Hover '?' for help)",
                                 options=['month-year', 'month-day'],
                                 help='For example, 2001-03-09 (yyyy-mm-dd) may either be Mar-01 (MARCHF1) or Mar-09 (MARCHF9).',
                                 index=1)
     num_exp.info("If you're unsure about the above option, check the converted dataframe and select 'month-year.' "
                  "We recommend you to check the converted dataframe to ensure that the dates are converted correctly. If unsuccessful, <NA> symbols will populate at the bottom of the converted dataframe.")
-    if info_stored == 'month-year':
-        strfmt = '%b-%y'
-    else:
-        strfmt = '%b-%d'
-    a = []
-    df.reset_index(drop=False, inplace=True)
-    index_nm = df.columns.tolist()[0]
-    for n in numdate:
-        indices = df.index[df[index_nm] == n].tolist()
-        if indices not in a:
-            a.append(indices)
-    flattened = [item for sublist in a for item in sublist]
-    found = df.iloc[flattened,:]
-    found.set_index(index_nm, inplace=True)
+    found = df[df.index.isin(numdate)]
     num_exp.write(f"**{k} dataframe**")
     num_exp.dataframe(found)
-
-    if date_fmt == "yyyy-dd-mm":
-        extracted = {n:(dateparser.parse(n, date_formats=["%Y-%d-%m"])).strftime(strfmt) for n in numdate}
-    elif date_fmt == "yyyy-mm-dd":
-        extracted = {n:(dateparser.parse(n, date_formats=["%Y-%m-%d"])).strftime(strfmt) for n in numdate}
-    elif date_fmt == "dd-mm-yyyy":
-        extracted = {n:(dateparser.parse(n, date_formats=["%d-%m-%Y"])).strftime(strfmt) for n in numdate}
-    elif date_fmt == "mm-dd-yyyy":
-        extracted = {n:(dateparser.parse(n, date_formats=["%m-%d-%Y"])).strftime(strfmt) for n in numdate}
-
-    global misidentified
-    misidentified = ";".join(extracted.keys())
-    df.set_index(index_nm, inplace=True)
-    df.rename(index=extracted, inplace=True)
-    return df
-
-############################ Just old symbols and no date issues ###############################
-def nodates(df):
-    corrected = {}
-    for i in range(len(reference_symbols)):
-        key = reference_symbols.iloc[i, 0]
-        value = reference_symbols.iloc[i, 1]
-        corrected[key] = value
-
-    global misidentified
-    misidentified = ";".join(corrected.keys())
-    df.rename(index=corrected, inplace=True)
-    cleaned_dict[k] = df
-    return
+    return options
 
 ########################################## Completed Dataframes ######################################################
 def completed():
@@ -377,51 +234,52 @@ def completed():
 
 ################################################# Code Flow ##########################################################
 
-# since it's quite likely that old symbols don't exist together with dates (because once opened in excel all are dates),
-# this is an all-or-none approach where if date search picks up sth, old search will be empty
-# if both lists are empty, nothing is wrong, then cleaned dict[k] = df_dict[k], where k is df with no error
+# the conversion itself happens in date_gene_engine; the script only collects the choices that need a human
 
 ismar, isnums = 0, 0
+report_dict = {}
+
+keep_order = st.sidebar.checkbox("Keep the original row order",
+                                 help="Rows are sorted by gene name unless this is ticked. Keeping the order is faster for large files.")
+duplicates = st.sidebar.selectbox("Rows that end up with the same gene", options=list(engine.DUPLICATE_STRATEGIES),
+                                  help="keep: leave all rows; first/last: keep one row; sum/mean/max/min: merge their values into one row.")
 
 for k,df in df_dict.items():
-    date_search = [g for g in df.index.tolist() if re.search("^Mar-|^Apr-|^Sept?-|^Oct-|^Dec-", g, flags=re.I)] # dates
-    old_symbols = list(reference_symbols['Previous Symbol'])
-    old_search = list(set(df.index.tolist()).intersection(set(old_symbols))) # easy way to find old symbols in df index
-    if len(date_search) != 0:
-        march_search = [m for m in date_search if re.search("^Mar-0?1|^0?1-Mar|^Mar-0?2|^0?2-Mar", m, flags=re.I)] # only march genes
-        if len(march_search) != 0:
-            ismar += 1
-            if ismar == 1:
-                st.subheader("Resolve Duplicate Gene Symbols")
-            march_resolver(df) # will have all the date genes (like it is now)
-        else:
-            date_resolver(df, date_search) # will exclude march
-
-    elif len(old_search) != 0:
-        nodates(df) # converts old to new (eg. DEC1 -> DELEC1)
-
-    elif len(date_search) == 0 and len(old_search) == 0:
-        numdate = [g for g in df.index.tolist() if re.search("^\d*[-/]?\W", g, flags=re.I)]
-        if len(numdate) != 0:
-            isnums += 1
-            if isnums == 1:
-                st.subheader("Resolve Date Format")
-            renamed = numeric_date(k,df,numdate)
-            march_search = [m for m in renamed.index.tolist() if re.search("^Mar-0?1|^0?1-Mar|^Mar-0?2|^0?2-Mar", m, flags=re.I)]  # only march genes
-            generic_date = [g for g in renamed.index.tolist() if re.search("^Mar-|^Apr-|^Sept?-|^Oct-|^Dec-", g, flags=re.I)]
-            if len(march_search) != 0:
-                ismar += 1
-                if ismar == 1:
-                    st.subheader("Resolve Duplicate Gene Symbols")
-                    march_resolver(renamed)  # will have all the date genes (like it is now)
-            else:
-                date_resolver(renamed, generic_date)  # will exclude march
-        else:
-            st.success(f"No errors detected for {k} dataframe")
-            cleaned_dict[k] = df
-    else:
+    options = engine.ConversionOptions(row_order="original" if keep_order else "sorted", duplicates=duplicates)
+    if engine.classify(df, reference) == "numeric":
+        isnums += 1
+        if isnums == 1:
+            st.subheader("Resolve Date Format")
+        options = numeric_date(k, df, options)
+
+    found = engine.march_rows(df, options, reference)
+    if len(found) != 0:
+        ismar += 1
+        if ismar == 1:
+            st.subheader("Resolve Duplicate Gene Symbols")
+        options = march_resolver(k, found, options)
+
+    cleaned, report = conversions.convert(df, options, reference)  # a lookup when nothing changed since the last rerun
+    if len(report.ambiguous) != 0:
+        st.warning(f"{k} dataframe: these are previous symbols of more than one gene and were left as they are: " +
+                   "; ".join(f"{label} ({', '.join(genes)})" for label, genes in report.ambiguous.items()))
+    if report.status == "clean":
         st.success(f"No errors detected for {k} dataframe")
-        cleaned_dict[k] = df
+    cleaned_dict[k] = cleaned
+    report_dict[k] = report
 
 # No matter what the flow is, the program returns a completed section
 completed()
+
+if st.sidebar.checkbox("Show conversion reports"):
+    st.subheader("Conversion Reports")
+    for k, report in report_dict.items():
+        with st.expander(f"{k} dataframe: {report.status}, {report.rows_in} rows in, {report.rows_out} rows out"):
+            st.write("Labels changed by each rule:", report.changes)
+            if len(report.missing) != 0:
+                st.warning(f"These labels became <NA>: {', '.join(report.missing)}")
+            st.dataframe(report.to_frame().query("section == 'stage'")[["name", "seconds", "rows"]])
+            st.download_button("Download report (JSON)", report.to_json(indent=1), file_name=f"report_{k}.json",
+                               mime="application/json")
+            st.download_button("Download report (CSV)", report.to_frame().to_csv(index=False),
+                               file_name=f"report_{k}.csv", mime="text/csv")
@@ -0,0 +1,103 @@
+import os
+from types import SimpleNamespace
+
+import pandas as pd
+
+import date_gene_cache as gene_cache
+import date_gene_engine as engine
+
+
+def frame(rows, start=0):
+    return pd.DataFrame({"value": range(start, start + rows)}, index=[f"G{i}" for i in range(start, start + rows)])
+
+
+def entry(rows, start=0):
+    return frame(rows, start), engine.ConversionReport(rows_in=rows, rows_out=rows)
+
+
+def test_evicts_least_recently_used_by_size():
+    size = gene_cache._size(frame(100))
+    cache = gene_cache.ConversionCache(max_bytes=2 * size + size // 2)
+    for key in "abc":
+        cache.put(key, *entry(100))
+    assert list(cache._entries) == ["b", "c"]
+    assert cache.nbytes == 2 * size <= cache.max_bytes
+
+
+def test_hit_moves_entry_to_end():
+    size = gene_cache._size(frame(100))
+    cache = gene_cache.ConversionCache(max_bytes=2 * size)
+    cache.put("a", *entry(100))
+    cache.put("b", *entry(100))
+    assert cache.get("a") is not None
+    cache.put("c", *entry(100))
+    assert list(cache._entries) == ["a", "c"]
+
+
+def test_skips_entry_larger_than_cap():
+    cache = gene_cache.ConversionCache(max_bytes=gene_cache._size(frame(10)))
+    cache.put("small", *entry(10))
+    cache.put("large", *entry(1000))
+    assert list(cache._entries) == ["small"]
+    assert cache.get("large") is None
+
+
+def test_hits_and_misses():
+    cache = gene_cache.ConversionCache()
+    assert cache.get("a") is None
+    cache.put("a", *entry(3))
+    cleaned, report = cache.get("a")
+    assert cleaned.equals(frame(3)) and report.rows_in == 3
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_disk_round_trip(tmp_path):
+    cache = gene_cache.ConversionCache(directory=str(tmp_path))
+    cache.put("a", *entry(5))
+    assert os.path.exists(tmp_path / "a.pkl")
+    fresh = gene_cache.ConversionCache(directory=str(tmp_path))  # a new process finds it on disk
+    cleaned, report = fresh.get("a")
+    assert cleaned.equals(frame(5)) and report.rows_out == 5
+    assert (fresh.hits, fresh.misses) == (1, 0)
+    assert list(fresh._entries) == ["a"]  # and keeps it in memory from then on
+
+
+def test_disk_entries_evicted_from_memory(tmp_path):
+    cache = gene_cache.ConversionCache(max_bytes=gene_cache._size(frame(100)), directory=str(tmp_path))
+    cache.put("a", *entry(100))
+    cache.put("b", *entry(100))
+    assert list(cache._entries) == ["b"]
+    assert cache.get("a")[0].equals(frame(100))
+
+
+def test_trim_disk_keeps_to_max_disk_bytes(tmp_path):
+    cache = gene_cache.ConversionCache(directory=str(tmp_path), max_disk_bytes=10 ** 9)
+    for i, key in enumerate("abcd"):
+        cache.put(key, *entry(200))
+        os.utime(tmp_path / f"{key}.pkl", (i, i))  # a is the oldest
+    size = os.path.getsize(tmp_path / "a.pkl")
+    cache.max_disk_bytes = 2 * size + size // 2
+    cache._trim_disk()
+    assert sorted(os.listdir(tmp_path)) == ["c.pkl", "d.pkl"]
+
+
+def test_key_follows_options_and_reference():
+    df = frame(3)
+    reference = SimpleNamespace(version="v1")
+    key = gene_cache.conversion_key(df, engine.ConversionOptions(), reference)
+    assert key == gene_cache.conversion_key(frame(3), engine.ConversionOptions(), SimpleNamespace(version="v1"))
+    others = [gene_cache.conversion_key(df, engine.ConversionOptions(mar01_first="MARCHF1"), reference),
+              gene_cache.conversion_key(df, engine.ConversionOptions(date_format="yyyy-mm-dd"), reference),
+              gene_cache.conversion_key(df, engine.ConversionOptions(), SimpleNamespace(version="v2")),
+              gene_cache.conversion_key(frame(3, start=1), engine.ConversionOptions(), reference)]
+    assert len({key, *others}) == 5
+
+
+def test_convert_answers_from_cache():
+    cache = gene_cache.ConversionCache()
+    df = pd.DataFrame({"value": [1, 2]}, index=["DEC1", "TP53"])
+    cleaned, report = cache.convert(df)
+    assert list(cleaned.index) == ["DELEC1", "TP53"]
+    again, second = cache.convert(df.copy())
+    assert again is cleaned and second is report
+    assert (cache.hits, cache.misses) == (1, 1)
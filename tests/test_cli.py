@@ -0,0 +1,40 @@
+import pytest
+
+import date_gene_batch as batch
+import date_gene_cli as cli
+
+
+def test_expand_inputs_skips_earlier_outputs(tmp_path):
+    for name in ["x.csv", "cleaned_x.csv", "y.tsv.gz", "notes.md"]:
+        (tmp_path / name).write_text("gene\nDEC1\n")
+    expected = [str(tmp_path / "x.csv"), str(tmp_path / "y.tsv.gz")]
+    assert cli.expand_inputs([str(tmp_path)]) == expected
+    assert cli.expand_inputs([str(tmp_path / "*.csv"), str(tmp_path / "*.gz"), str(tmp_path / "x.csv")]) == expected
+
+
+def test_output_paths_refuse_clashes(tmp_path):
+    paths = [str(tmp_path / "a" / "x.csv"), str(tmp_path / "b" / "x.csv")]
+    assert batch.output_paths(paths) == [str(tmp_path / "a" / "cleaned_x.csv"), str(tmp_path / "b" / "cleaned_x.csv")]
+    with pytest.raises(ValueError, match="overwrite"):
+        batch.output_paths(paths, str(tmp_path / "out"))
+    with pytest.raises(ValueError):
+        batch.convert_files(paths, output_dir=str(tmp_path / "out"), workers=1)
+
+
+def test_cli_refuses_clashing_outputs(tmp_path, capsys):
+    for folder in ["a", "b"]:
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "x.csv").write_text("gene,value\nDEC1,1\n")
+    with pytest.raises(SystemExit):
+        cli.main([str(tmp_path / "a" / "x.csv"), str(tmp_path / "b" / "x.csv"), "-o", str(tmp_path / "out")])
+    assert "overwrite" in capsys.readouterr().err
+    assert not (tmp_path / "out").exists()
+
+
+def test_convert_files_reports_unknown_formats(tmp_path):
+    (tmp_path / "genes.txt").write_text("gene,value\nDEC1,1\n")
+    (tmp_path / "book.xls").write_bytes(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + bytes(64))
+    good, bad = batch.convert_files([str(tmp_path / "genes.txt"), str(tmp_path / "book.xls")], workers=1)
+    assert good.error is None
+    assert (tmp_path / "cleaned_genes.txt").read_text() == "gene,value\nDELEC1,1\n"
+    assert "not a CSV/TSV" in bad.error
@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import date_gene_engine as engine
+
+
+def test_date_numbers():
+    numbers, digits = engine._date_numbers(["2021-03-01 00:00:00", "01/03/2021", "DEC1"])
+    assert numbers.tolist() == [[2021, 3, 1], [1, 3, 2021], [0, 0, 0]]
+    assert digits.tolist() == [[4, 2, 2], [2, 2, 4], [0, 0, 0]]
+
+
+@pytest.mark.parametrize("label, date_format, valid", [
+    ("2020-02-29", "yyyy-mm-dd", True),
+    ("2021-02-29", "yyyy-mm-dd", False),  # not a leap year
+    ("1900-02-29", "yyyy-mm-dd", False),
+    ("2000-02-29", "yyyy-mm-dd", True),
+    ("2021-04-31", "yyyy-mm-dd", False),
+    ("2021-13-01", "yyyy-mm-dd", False),
+    ("2021-00-01", "yyyy-mm-dd", False),
+    ("2021-01-13", "yyyy-dd-mm", False),
+    ("13-01-2021", "dd-mm-yyyy", True),
+    ("21-01-13", "yyyy-mm-dd", False),  # two-digit year
+])
+def test_valid_dates(label, date_format, valid):
+    numbers, digits = engine._date_numbers([label])
+    assert engine._valid_dates(numbers, digits, date_format)[0].tolist() == [valid]
+
+
+@pytest.mark.parametrize("labels, expected", [
+    (["2021-03-13", "2021-12-25"], "yyyy-mm-dd"),
+    (["2021-13-03", "2021-25-12"], "yyyy-dd-mm"),
+    (["13/03/2021"], "dd-mm-yyyy"),
+    (["03/13/2021"], "mm-dd-yyyy"),
+    (["2021-03-01"], None),  # both yyyy layouts fit
+    (["2021-13-13"], None),
+    ([], None),
+])
+def test_infer_date_format(labels, expected):
+    assert engine.infer_date_format(labels) == expected
+
+
+def test_numeric_mapping():
+    options = engine.ConversionOptions(date_format=engine.AUTO_DATE_FORMAT)
+    report = engine.ConversionReport()
+    mapping = engine.numeric_mapping(["2021-03-13", "2021-09-01 00:00:00"], options, report)
+    assert report.date_format == "yyyy-mm-dd"
+    assert mapping == {"2021-03-13": "Mar-13", "2021-09-01 00:00:00": "Sep-01"}
+
+
+def test_numeric_mapping_leaves_invalid_dates():
+    options = engine.ConversionOptions(date_format="yyyy-mm-dd")
+    assert engine.numeric_mapping(["2021-09-31", "2021-09-30"], options) == {"2021-09-30": "Sep-30"}
+
+
+def test_numeric_mapping_month_year():
+    options = engine.ConversionOptions(date_format="dd-mm-yyyy", date_info="month-year")
+    assert engine.numeric_mapping(["01-03-2021", "02-12-2009"], options) == {"01-03-2021": "Mar-21",
+                                                                              "02-12-2009": "Dec-09"}
+
+
+def test_numeric_mapping_default_layout():
+    mapping = engine.numeric_mapping(["2021-01-03"], engine.ConversionOptions())
+    assert mapping == {"2021-01-03": "Mar-01"}
+
+
+def test_march_without_descriptions_needs_review():
+    options = engine.ConversionOptions(mar_resolution="description")
+    df = pd.DataFrame(index=["Mar-01", "Mar-02", "TP53"])  # no description column
+    cleaned, report = engine.convert(df, options)
+    assert list(cleaned.index) == ["MTARC1", "MTARC2", "TP53"]
+    assert report.needs_review == ["MAR-01_1st", "MAR-02_1st"]
+    assert [(c.date, c.genes, c.method, c.automatic) for c in report.march_choices] == [
+        ("Mar-01", ["MTARC1"], "none", False), ("Mar-02", ["MTARC2"], "none", False)]
+    assert report.changes["mar_order"] == 2
+
+    new, report = engine.relabel(["MAR-02", "DEC1", "MAR-02"], options)
+    assert list(new) == ["MTARC2", "DEC1", "MARCHF2"]
+    assert report.needs_review == ["MAR-02_1st", "MAR-02_2nd"]
+
+
+def test_classify_and_march_rows_leave_df_alone():
+    df = pd.DataFrame({"description": ["membrane associated ring", "x", "y", "z"]},
+                      index=["2021-01-03", "tp53", "2021-02-03", "2021-01-03"])
+    before = df.copy()
+    assert engine.classify(df) == "numeric"
+    found = engine.march_rows(df, engine.ConversionOptions(date_format="yyyy-dd-mm"))
+    assert found.index.tolist() == ["Mar-01_1st", "Mar-02_1st", "Mar-01_2nd"]
+    assert found["description"].tolist() == ["membrane associated ring", "y", "z"]
+    assert df.equals(before)
+    assert engine.march_rows(df.iloc[1:2]).empty
+
+
+def duplicated_frame():
+    # SEP-09 becomes SEPTIN9, the same gene as the row after it
+    return pd.DataFrame({"count": [1, 2, 3, 4], "flag": [True, False, True, False], "note": ["a", "b", "c", "d"]},
+                        index=pd.Index(["TP53", "SEP-09", "SEPTIN9", "A1BG"], name="gene"))
+
+
+def test_relabel_frame_keeps_order_and_shares_data():
+    df = pd.DataFrame({"a": np.arange(4.0), "b": np.arange(4)}, index=["TP53", "DEC1", "SEPT9", "A1BG"])
+    frame, report = engine.relabel_frame(df)
+    assert list(frame.index) == ["TP53", "DELEC1", "SEPTIN9", "A1BG"]
+    assert all(np.shares_memory(frame[c].to_numpy(), df[c].to_numpy()) for c in df.columns)
+    assert list(df.index) == ["TP53", "DEC1", "SEPT9", "A1BG"]
+    same, _ = engine.relabel_frame(df, inplace=True)
+    assert same is df and list(df.index) == ["TP53", "DELEC1", "SEPTIN9", "A1BG"]
+
+
+def test_convert_original_order_uses_relabel_frame():
+    cleaned, report = engine.convert(duplicated_frame(), engine.ConversionOptions(row_order="original"))
+    assert list(cleaned.index) == ["TP53", "SEPTIN9", "SEPTIN9", "A1BG"]
+    assert cleaned["count"].tolist() == [1, 2, 3, 4]
+    assert cleaned.index.name == "gene"
+
+
+@pytest.mark.parametrize("row_order, how, genes, counts", [
+    ("sorted", "first", ["A1BG", "SEPTIN9", "TP53"], [4, 3, 1]),
+    ("sorted", "last", ["A1BG", "SEPTIN9", "TP53"], [4, 2, 1]),
+    ("original", "first", ["TP53", "SEPTIN9", "A1BG"], [1, 2, 4]),
+    ("original", "last", ["TP53", "SEPTIN9", "A1BG"], [1, 3, 4]),
+])
+def test_first_and_last(row_order, how, genes, counts):
+    options = engine.ConversionOptions(row_order=row_order, duplicates=how)
+    cleaned, report = engine.convert(duplicated_frame(), options)
+    assert list(cleaned.index) == genes
+    assert cleaned["count"].tolist() == counts
+    assert report.changes[f"duplicates_{how}"] == 1 and report.rows_out == 3
+
+
+def test_sum_and_mean_leave_bool_and_object_columns():
+    df = duplicated_frame().set_axis(["TP53", "SEPTIN9", "SEPTIN9", "A1BG"])
+    summed = engine.collapse_duplicates(df, "sum")
+    assert summed["count"].tolist() == [1, 5, 4] and summed["count"].dtype == np.int64
+    averaged = engine.collapse_duplicates(df, "mean")
+    assert averaged["count"].tolist() == [1.0, 2.5, 4.0] and averaged["count"].dtype == np.float64
+    for merged in (summed, averaged):
+        assert merged["flag"].tolist() == [True, False, False] and merged["flag"].dtype == bool
+        assert merged["note"].tolist() == ["a", "b", "d"]
+    assert df["count"].tolist() == [1, 2, 3, 4]  # df itself is left alone
+
+
+@pytest.mark.parametrize("how", ["first", "last", "sum", "max"])
+def test_missing_genes_are_never_merged(how):
+    df = pd.DataFrame({"count": [1, 2, 3, 4, 5]}, index=pd.Index(["A", pd.NA, "A", pd.NA, "B"], dtype=object))
+    merged = engine.collapse_duplicates(df, how)
+    assert merged.index.isna().sum() == 2
+    assert merged.loc[merged.index.isna(), "count"].tolist() == [2, 4]
+
+
+def test_collapse_duplicates_rejects_unknown_strategy():
+    with pytest.raises(ValueError):
+        engine.collapse_duplicates(duplicated_frame(), "median")
+
+
+@pytest.mark.parametrize("descriptions", [
+    ["membrane associated ring-CH-type finger 2"],
+    ["membrane associated ring-CH-type finger 2", "mitochondrial amidoxime reducing component 1"],
+])
+def test_description_of_another_gene_needs_review(descriptions):
+    labels = ["MAR-01_1st", "MAR-01_2nd"][:len(descriptions)]
+    assignments, choices = engine.resolve_march(labels, descriptions)
+    assert assignments == {}
+    assert not choices[0].automatic
+
+
+def test_description_numeral_must_match():
+    assert engine.name_score("membrane associated ring-CH-type finger 2", "membrane associated ring-CH-type finger 1") \
+        == (0.0, "numeral")
+    assignments, choices = engine.resolve_march(["MAR-01_1st", "MAR-01_2nd"],
+                                                ["membrane associated ring-CH-type finger 1",
+                                                 "mitochondrial amidoxime reducing component 1"])
+    assert assignments == {"MAR-01_1st": "MARCHF1", "MAR-01_2nd": "MTARC1"} and choices[0].automatic
@@ -0,0 +1,114 @@
+import io
+
+import pandas as pd
+import pytest
+
+import date_gene_engine as engine
+import date_gene_io as gene_io
+
+
+def records(text, sep=","):
+    return list(gene_io._records(io.StringIO(text, newline=""), sep))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("a,1\nb,2\n", ["a,1\n", "b,2\n"]),
+    ("a,1\nb,2", ["a,1\n", "b,2"]),  # no trailing newline
+    ("a,1\r\nb,2\r\n", ["a,1\r\n", "b,2\r\n"]),
+    ("a,1\n\n\r\nb,2\n\n", ["a,1\n", "b,2\n"]),  # blank lines
+    ('a,"x\ny",1\nb,2\n', ['a,"x\ny",1\n', "b,2\n"]),  # quoted newline
+    ('a,"x\r\n\r\ny"\r\nb,2\r\n', ['a,"x\r\n\r\ny"\r\n', "b,2\r\n"]),
+    ('a,"say ""hi""\nthere",1\nb,2\n', ['a,"say ""hi""\nthere",1\n', "b,2\n"]),  # "" escapes
+    ('a,""\nb,"""\n"""\n', ['a,""\n', 'b,"""\n"""\n']),
+    ('DEC1,5" screw,1\nb,2\n', ['DEC1,5" screw,1\n', "b,2\n"]),  # stray quote in an unquoted field
+    ('a,5" and 6",1\nb,"x""\n', ['a,5" and 6",1\n', 'b,"x""\n']),
+])
+def test_records(text, expected):
+    assert records(text) == expected
+
+
+def test_records_tab_separated():
+    assert records('a\t5" screw\nb\t"x\ty\nz"\n', sep="\t") == ['a\t5" screw\n', 'b\t"x\ty\nz"\n']
+
+
+def test_records_match_pandas():
+    text = 'gene,note,value\nDEC1,5" screw,1\n"Mar-01","two\nlines",2\n\nSEPT9,"a ""b""",3\r\nTP53,x,4'
+    assert len(records(text)) - 1 == len(pd.read_csv(io.StringIO(text)))
+
+
+@pytest.mark.parametrize("record, expected", [
+    ("DEC1,5,6\n", ",5,6\n"),
+    ("DEC1\n", "\n"),
+    ("DEC1\r\n", "\r\n"),
+    ("DEC1", ""),
+    ('"DEC1",5\n', ",5\n"),
+    ('"a,""b""\nc",5\r\n', ",5\r\n"),
+    ('"a"\n', "\n"),
+    ('DEC1,"x\ny"\n', ',"x\ny"\n'),
+])
+def test_rest(record, expected):
+    assert gene_io._rest(record, ",") == expected
+
+
+def test_field_quotes_when_needed():
+    assert gene_io._field("DELEC1", ",") == "DELEC1"
+    assert gene_io._field('5" screw', ",") == '"5"" screw"'
+    assert gene_io._field("a,b", ",") == '"a,b"'
+    assert gene_io._field(pd.NA, ",") == ""
+
+
+def test_convert_csv_chunked_keeps_other_columns(tmp_path):
+    src = tmp_path / "genes.csv"
+    src.write_bytes(b'gene,note,value\r\nDEC1,5" screw,1\r\nSEPT9,"two\r\nlines",2\r\n\r\nTP53,"a ""b""",3')
+    dst = tmp_path / "cleaned_genes.csv"
+    report = gene_io.convert_csv_chunked(str(src), str(dst), chunksize=2)
+    assert dst.read_bytes() == (b'gene,note,value\r\nDELEC1,5" screw,1\r\nSEPTIN9,"two\r\nlines",2\r\n'
+                                b'TP53,"a ""b""",3')
+    assert report.rows_out == 3
+
+
+@pytest.mark.parametrize("head, name, expected", [
+    (b"gene,value\nDEC1,1\n", "genes.txt", gene_io.FileFormat("csv")),
+    (b"gene\tvalue\nDEC1\t1\n", "genes.txt", gene_io.FileFormat("tsv")),
+    (b"gene\tvalue\nDEC1\t1\n", "genes.csv", gene_io.FileFormat("csv")),  # the extension decides
+    (b"gene,value\n", "genes.tsv.gz", gene_io.FileFormat("tsv")),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + bytes(64), "book.xls", None),
+    (b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n", "paper.pdf", None),
+    (b"gene,value\n", "genes", None),
+    (b"junk", "genes.parquet", None),
+    (b"\xff\xfe\x00\x00g\x00", "genes.txt", None),
+])
+def test_detect_format(head, name, expected):
+    assert gene_io.detect_format(io.BytesIO(head), name) == expected
+
+
+def test_detect_format_compressed_text():
+    import gzip
+    def detect(data, name):
+        return gene_io.detect_format(io.BytesIO(gzip.compress(data)), name)
+
+    assert detect(b"gene\tvalue\n", "genes.gz") == gene_io.FileFormat("tsv", "gzip")
+    assert detect(b"gene,value\n", "genes.txt.gz") == gene_io.FileFormat("csv", "gzip")
+    assert detect(bytes(16), "genes.gz") is None
+
+
+def test_read_table_txt(tmp_path):
+    path = tmp_path / "genes.txt"
+    path.write_text("gene,value\nDEC1,1\nTP53,2\n")
+    df = gene_io.read_table(str(path))
+    assert list(df.index) == ["DEC1", "TP53"] and list(df.columns) == ["value"]
+    with pytest.raises(ValueError, match="not a CSV/TSV"):
+        gene_io.read_table(io.BytesIO(b"%PDF-1.7\n"))
+
+
+@pytest.mark.parametrize("name", ["genes.csv", "genes.csv.gz"])
+def test_convert_csv_chunked_gene_column_only(tmp_path, name):
+    import gzip
+    data = b"gene\nMar-01\nDEC1\nMar-01\n"
+    src = tmp_path / name
+    src.write_bytes(gzip.compress(data) if name.endswith(".gz") else data)
+    dst = tmp_path / "cleaned_genes.csv"
+    options = engine.ConversionOptions(mar_resolution="description")
+    report = gene_io.convert_csv_chunked(str(src), str(dst), options)
+    assert dst.read_text() == "gene\nMTARC1\nDEC1\nMARCHF1\n"
+    assert report.needs_review == ["MAR-01_1st", "MAR-01_2nd"]
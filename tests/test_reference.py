@@ -0,0 +1,82 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+import date_gene_reference as gene_reference
+
+ROWS = [("HGNC:1", "DELEC1", "deleted in esophageal cancer 1", "9q33.1", "DEC1", "AMB1|Xyz"),
+        ("HGNC:2", "MARCHF1", "membrane associated ring-CH-type finger 1", "4q32", "MARCH1", "AMB1"),
+        ("HGNC:3", "SEPTIN9", "septin 9", "17q25", "SEPT9", "xyz"),
+        ("HGNC:4", "TP53", "tumor protein p53", "17p13", "", "P53|SEPTIN9")]
+
+
+def write_hgnc(path, rows=ROWS):
+    with open(path, "w") as fp:
+        fp.write("hgnc_id\tsymbol\tname\tlocation\tprev_symbol\talias_symbol\n")
+        fp.writelines("\t".join(row) + "\n" for row in rows)
+    return str(path)
+
+
+@pytest.fixture
+def source(tmp_path):
+    gene_reference.hgnc_index.cache_clear()
+    yield write_hgnc(tmp_path / "hgnc_complete_set.txt")
+    gene_reference.hgnc_index.cache_clear()
+
+
+def test_parse_leaves_out_approved_symbols(source):
+    table = gene_reference.parse_hgnc_complete_set(source)
+    assert "SEPTIN9" not in set(table["Previous Symbol"])
+    assert sorted(table.loc[table["Previous Symbol"] == "AMB1", "Approved symbol"]) == ["DELEC1", "MARCHF1"]
+
+
+def test_cache_matches_table_index(source):
+    cached = gene_reference.hgnc_index(source)
+    table = gene_reference.SymbolIndex(gene_reference.parse_hgnc_complete_set(source))
+    labels = ["DEC1", "dec1", "SEPT9", "AMB1", "Xyz", "xyz", "XYZ", "P53", "TP53", "other"]
+    for case_sensitive in [True, False]:
+        assert list(cached.rename(labels, case_sensitive)) == list(table.rename(labels, case_sensitive))
+        assert cached.find(labels, case_sensitive) == table.find(labels, case_sensitive)
+        assert cached.find_ambiguous(labels, case_sensitive) == table.find_ambiguous(labels, case_sensitive)
+    assert dict(cached.exact) == dict(table.exact)
+    assert len(cached) == len(table)
+
+
+def test_ambiguous_symbols_are_not_renamed(source):
+    index = gene_reference.hgnc_index(source)
+    assert list(index.rename(["AMB1", "DEC1"])) == ["AMB1", "DELEC1"]
+    assert index.find_ambiguous(["AMB1", "DEC1"]) == {"AMB1": ["DELEC1", "MARCHF1"]}
+    assert index.find_ambiguous(["XYZ"], case_sensitive=False) == {"XYZ": ["DELEC1", "SEPTIN9"]}
+    assert list(index.rename(["Xyz", "xyz"])) == ["DELEC1", "SEPTIN9"]
+
+
+def test_cache_is_reused_and_rebuilt(source):
+    cache_dir = gene_reference.build_hgnc_cache(source)
+    assert gene_reference._cache_is_fresh(source, cache_dir)
+    os.utime(source, ns=(0, 0))  # touched but unchanged
+    assert gene_reference._cache_is_fresh(source, cache_dir)
+    with open(source, "a") as fp:
+        fp.write("HGNC:5\tBRCA1\tBRCA1 DNA repair associated\t17q21\tRNF53\t\n")
+    assert not gene_reference._cache_is_fresh(source, cache_dir)
+    assert list(gene_reference.hgnc_index(source).rename(["RNF53"])) == ["BRCA1"]
+    assert not [name for name in os.listdir(os.path.dirname(cache_dir)) if name.endswith((".tmp", ".old"))]
+
+
+def test_rebuild_keeps_open_arrays_readable(source):
+    index = gene_reference.SortedSymbolIndex(gene_reference.build_hgnc_cache(source))
+    keys = np.array(index._keys)
+    gene_reference.build_hgnc_cache(source)
+    assert np.array_equal(index._keys, keys)
+
+
+def _build(source):
+    return list(gene_reference.hgnc_index(source).rename(["DEC1", "AMB1"]))
+
+
+def test_concurrent_builds(source):
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        results = pool.map(_build, [source] * 8)
+    assert results == [["DELEC1", "AMB1"]] * 8
+    assert gene_reference._cache_is_fresh(source, source + ".cache")
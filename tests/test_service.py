@@ -0,0 +1,46 @@
+import asyncio
+import json
+
+import date_gene_service as service
+
+
+async def post(app, path, body, content_type=b"application/json"):
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "path": path, "method": "POST", "query_string": b"",
+             "headers": [(b"content-type", content_type)]}
+    await app(scope, receive, send)
+    return sent[0]["status"], json.loads(sent[1]["body"])
+
+
+def test_first_requests_start_one_batcher():
+    async def run():
+        app = service.ConversionService()
+        requests = asyncio.gather(*(post(app, "/symbols", b'["DEC1", "TP53"]') for _ in range(8)))
+        answers = await asyncio.wait_for(requests, 30)  # a request queued for a second batcher never returns
+        batchers = [task for task in asyncio.all_tasks() if "_run_batches" in repr(task)]
+        await app.shutdown()
+        return answers, len(batchers)
+
+    answers, batchers = asyncio.run(run())
+    assert batchers == 1
+    assert all(status == 200 and body["symbols"] == ["DELEC1", "TP53"] for status, body in answers)
+
+
+def test_convert_refuses_unknown_bodies():
+    async def run():
+        app = service.ConversionService()
+        pdf = b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n"
+        answers = [await post(app, "/convert", body, b"application/octet-stream") for body in [pdf, b"gene\nDEC1\n"]]
+        answers.append(await post(app, "/convert", pdf, b"application/vnd.apache.parquet"))
+        await app.shutdown()
+        return answers
+
+    assert [status for status, _ in asyncio.run(run())] == [415, 415, 400]